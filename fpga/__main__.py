@@ -1,12 +1,51 @@
+from time import perf_counter
+start_time = perf_counter()
+import os
+import atexit
 import click
 from fpga.cmds import FPGACLI
-from fpga.util import hook_signals
-from fpga.__init__ import __version__
+from fpga import __version__
+import_time = perf_counter()
+
+def process_age():
+    # Time since exec, so interpreter startup is accounted for too.
+    # Linux only; the kernel keeps it in clock ticks.
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - started / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def report_startup(group, age, mark):
+    now = perf_counter()
+    lines = []
+    if age is not None:
+        lines.append("interpreter {:.1f} ms".format(max(age - (mark - start_time), 0) * 1000))
+    lines.append("imports {:.1f} ms".format((import_time - start_time) * 1000))
+    if group.index_time is not None:
+        lines.append("command index {:.1f} ms".format(group.index_time * 1000))
+    if group.command_time is not None:
+        lines.append("command import {:.1f} ms".format(group.command_time * 1000))
+    if age is not None:
+        lines.append("total {:.1f} ms".format((age + now - mark) * 1000))
+    else:
+        lines.append("total {:.1f} ms since imports began".format((now - start_time) * 1000))
+    click.echo("startup: " + ", ".join(lines), err=True)
+
+def startup_profile(ctx, param, value):
+    if value and not ctx.resilient_parsing:
+        atexit.register(report_startup, ctx.command, process_age(), perf_counter())
 
 @click.group(cls=FPGACLI, help="""FPGA - Command Line Interface\n""", invoke_without_command=True)
 @click.version_option(__version__)
+@click.option('--startup-profile', is_flag=True, is_eager=True, expose_value=False, callback=startup_profile,
+              help='Report where startup time went on exit.')
 @click.pass_context
 def cli(ctx):
+    from fpga.util import hook_signals
     hook_signals()
     ctx.ensure_object(dict)
     if ctx.invoked_subcommand is None:
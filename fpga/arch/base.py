@@ -1,10 +1,15 @@
 import os
-import json
+import re
 import shutil
 import sys
 import click
-from fpga.util import get_directory
 from fpga.util import FPGAJob, FPGATask, FPGAAbort
+from fpga.util.manifest import BuildManifest
+from fpga.util.cache import ArtifactCache, link_or_copy
+from fpga.util.remote import RemoteCache
+from fpga.util.database import getBoardDatabase
+from fpga.util.tools import which
+from fpga.util.report import read_nextpnr_report, summarize_nextpnr_report, nextpnr_metrics
 
 def getArchitectures():
     arch_dir = os.path.dirname(__file__)
@@ -17,37 +22,206 @@ def getArchitectures():
     arch.sort()
     return arch
 
-def getArchitectureByName(ctx, name, project):
+def getArchitectureByName(ctx, name, project, job=None):
     mod = None
     try:
         mod = __import__("fpga.arch." + name, None, None, ["create"])
     except ImportError:
         click.secho('[{}] Invalid architecture {}'.format('validate', name), fg="red")
         sys.exit(-1)
-    return mod.create(ctx, project)
+    return mod.create(ctx, project, job)
 
 def getArchitectureMeta(name):
-    with open(os.path.join(get_directory('data'), 'arch', name + '.json')) as json_file:
-        data = json.load(json_file)
+    db = getBoardDatabase()
+    data = []
+    for device in db.getDevices(name):
+        item = db.getDevice(name, device)
+        data.append({ "device" : device, "name" : item["name"], "packages" : sorted(item["packages"]) })
     return data
 
 def getArchitecturesMeta():
     data = dict()
     for arch in getArchitectures():
-        arch_data = getArchitectureMeta(arch)
-        for key in arch_data:
-            arch_data[key]['arch'] = arch
-        data.update(arch_data)
+        for item in getArchitectureMeta(arch):
+            item['arch'] = arch
+            data[item['device']] = item
     return data
 
+def getArtifactCache(ctx, job):
+    if not ctx.obj.get("cache", True):
+        return None
+    if "artifact_cache" not in ctx.obj:
+        remote = None
+        if ctx.obj.get("remote_cache"):
+            remote = RemoteCache(ctx.obj["remote_cache"], ctx.obj["remote_timeout"], warning=job.warning)
+        ctx.obj["artifact_cache"] = ArtifactCache(remote=remote)
+    return ctx.obj["artifact_cache"]
+
+class FPGAStepTask(FPGATask):
+    def __init__(self, arch, step, description, deps, inputs, outputs, cmdline, tools):
+        super().__init__(arch.job, step, deps, cmdline, configuration=arch.configuration)
+        self.arch = arch
+        self.description = description
+        self.inputs = inputs
+        self.outputs = outputs
+        self.tools = tools
+        self.signature = cmdline
+        self.key = None
+
+    def prepare(self):
+        return self.arch.prepareStep(self)
+
+    def handle_exit(self, retcode):
+        super().handle_exit(retcode)
+        if not self.terminated:
+            self.arch.finishStep(self)
+
+fmax_regex = re.compile(r"Max frequency for clock '(.+)': ([0-9.]+) MHz \((PASS|FAIL) at ([0-9.]+) MHz\)")
+
+class FPGASeedTask(FPGATask):
+    def __init__(self, sweep, seed, deps, cmdline):
+        super().__init__(sweep.arch.job, "{}.seed{}".format(sweep.info, seed), deps, cmdline, configuration=sweep.arch.configuration)
+        self.sweep = sweep
+        self.seed = seed
+        self.work_dir = os.path.join(sweep.arch.work_dir, "seed-{}".format(seed))
+        self.routed = False
+        self.fmax = dict()
+        self.retcode = None
+        self.noprintregex = re.compile(r"^Info: (?!Max frequency)")
+
+    def prepare(self):
+        if not self.sweep.needed or self.sweep.winner is not None:
+            return False
+        os.makedirs(self.work_dir, exist_ok=True)
+        for x in self.sweep.outputs:
+            x = os.path.join(self.work_dir, os.path.basename(x))
+            if os.path.lexists(x):
+                os.remove(x)
+        return True
+
+    def handle_output(self, line):
+        if self.terminated:
+            return
+        # nextpnr also prints estimates after placement; only the timing
+        # report that follows routing is final.
+        m = fmax_regex.search(line)
+        if m is not None and self.routed:
+            self.fmax[m.group(1)] = (float(m.group(2)), m.group(3) == "PASS")
+        elif "Routing complete" in line:
+            self.routed = True
+            self.fmax = dict()
+        elif self.fmax:
+            self.sweep.check(self)
+        self.log(line)
+
+    def handle_exit(self, retcode):
+        if self.terminated:
+            return
+        self.retcode = retcode
+        try:
+            report = read_nextpnr_report(os.path.join(self.work_dir, 'report.json'))
+            self.fmax = { clock : (data["achieved"], data["achieved"] >= data.get("constraint", 0))
+                    for clock, data in report.get("fmax", {}).items() }
+        except (OSError, ValueError, KeyError):
+            pass
+        if retcode != 0:
+            self.job.warning("{}: failed (returncode={})".format(self.info, retcode), self.configuration)
+        self.sweep.check(self)
+
+    def score(self):
+        if self.retcode != 0 or not self.fmax:
+            return -1.0
+        return min(fmax for fmax, passed in self.fmax.values())
+
+class FPGASeedSelectTask(FPGATask):
+    def __init__(self, sweep):
+        super().__init__(sweep.arch.job, sweep.info, sweep.seeds, None, configuration=sweep.arch.configuration, silent=True)
+        self.sweep = sweep
+
+    def prepare(self):
+        self.sweep.finishSweep()
+        return False
+
+class FPGASeedSweepTask(FPGAStepTask):
+    def __init__(self, arch, step, description, deps, inputs, outputs, cmdline, tools, params, seeds):
+        super().__init__(arch, step, description, deps, inputs, outputs, None, tools)
+        self.signature = "{} --seeds {}".format(cmdline, seeds)
+        self.target = arch.project.getFrequency()
+        self.needed = False
+        self.winner = None
+        self.seeds = []
+        for seed in range(1, seeds + 1):
+            seed_dir = os.path.join(arch.work_dir, "seed-{}".format(seed))
+            seed_params = [ os.path.join(seed_dir, os.path.basename(x)) if x in outputs else x for x in params ]
+            self.seeds.append(FPGASeedTask(self, seed, [ self ], "{} {} --seed {}".format(tools[0], " ".join(seed_params), seed)))
+        self.select = FPGASeedSelectTask(self)
+
+    def prepare(self):
+        # The key check gates the seed runs; the seeds themselves are
+        # separate tasks and the selection completes once they are done.
+        self.needed = self.arch.prepareStep(self)
+        return False
+
+    def check(self, seed):
+        if self.winner is not None or self.target is None or not seed.fmax:
+            return
+        if not all(passed for fmax, passed in seed.fmax.values()):
+            return
+        self.winner = seed
+        self.job.log("{}: seed {} meets {} MHz target, terminating remaining runs".format(
+                click.style(self.info, fg="magenta"), seed.seed, self.target), self.configuration)
+        for other in self.seeds:
+            if other is not seed and not other.finished:
+                other.terminate()
+                other.complete()
+
+    def finishSweep(self):
+        if not self.needed:
+            return
+        best = self.winner
+        if best is None:
+            best = max(self.seeds, key=lambda x: x.score())
+        if best.score() < 0:
+            self.job.error("{}: no seed completed".format(click.style(self.info, fg="magenta")), self.configuration)
+            return
+        self.job.log("{}: using seed {} ({})".format(click.style(self.info, fg="magenta"), best.seed,
+                ", ".join("{} {:.2f} MHz".format(clock, fmax) for clock, (fmax, passed) in sorted(best.fmax.items()))), self.configuration)
+        for x in self.outputs:
+            if os.path.lexists(x):
+                os.remove(x)
+            link_or_copy(os.path.join(best.work_dir, os.path.basename(x)), x)
+        self.arch.finishStep(self)
+
+class FPGAReportTask(FPGATask):
+    def __init__(self, arch, deps, filename):
+        super().__init__(arch.job, "report", deps, None, configuration=arch.configuration, silent=True)
+        self.filename = filename
+
+    def prepare(self):
+        try:
+            report = read_nextpnr_report(self.filename)
+        except (OSError, ValueError):
+            self.job.warning("{}: no usable nextpnr report".format(self.info), self.configuration)
+            return False
+        self.job.config_summary[self.configuration].extend(summarize_nextpnr_report(report))
+        self.job.config_metrics[self.configuration].update(nextpnr_metrics(report))
+        return False
+
 class BaseArchitecture():
-    def __init__(self, ctx, name, project):
+    def __init__(self, ctx, name, project, job=None):
         self.name = name
         self.project = project
-        self.arch_data = getArchitectureMeta(name)
-        self.work_dir = os.path.join(".fpga", project.getConfiguration())
+        self.configuration = project.getConfiguration()
+        self.db = getBoardDatabase()
+        self.work_dir = os.path.join(".fpga", self.configuration)
         os.makedirs(self.work_dir, exist_ok=True)
-        self.job = FPGAJob([], [], [], project.getConfiguration())
+        if job is None:
+            job = FPGAJob([], [], [], self.configuration)
+        self.job = job
+        self.job.add_configuration(self.configuration)
+        self.manifest = BuildManifest(self.work_dir)
+        self.cache = getArtifactCache(ctx, self.job)
+        self.seeds = ctx.obj.get("seeds", 1)
 
     def getName(self):
         return self.name
@@ -63,66 +237,90 @@ class BaseArchitecture():
         return []
 
     def validateProject(self):
-        for item in self.arch_data:
-            if item['device']==self.project.getDevice():
-                if self.project.getPackage() in item['packages']:
-                    return True
-                click.secho('[{}] Unknown package {} for {} device'.format('validate', self.project.getPackage(), self.project.getDevice()), fg="red")
-                return False
+        if self.db.getDevice(self.name, self.project.getDevice()) is not None:
+            if self.db.hasPackage(self.name, self.project.getDevice(), self.project.getPackage()):
+                return True
+            click.secho('[{}] Unknown package {} for {} device'.format('validate', self.project.getPackage(), self.project.getDevice()), fg="red")
+            return False
         click.secho('[{}] Unknown device {} for architecture {}'.format('validate', self.project.getDevice(), self.name), fg="red")
         return False
 
-    def executeYosys(self, scriptfile):
-        if (shutil.which('yosys')):
-            #with open(scriptfile, 'r') as f:
-            #	for line in f.readlines():
-            #		click.secho('[{}] {}'.format('yosys script', line.strip()), fg="yellow")
-            #if self.settings.get("verbose") != "True":
-            #params.append("-q")
-            #run_command(params, cwd=self.work_dir)#, identifier='yosys')
-            FPGATask(self.job, "synth", [], f"yosys {scriptfile} -q")
-            self.job.run()
-        
-        else:
-            click.secho('Executable for {} not available, install'.format('yosys'), fg="red")
-
-    def executeNextPnR(self, params):
-        if (shutil.which('nextpnr-' + self.name)):
-            #if self.settings.get("verbose") != "True":
-            #params.append("-q")
-            #run_command(['nextpnr-' + self.name] + params, cwd=self.work_dir) #, identifier='nextpnr')
-            FPGATask(self.job, "pnr", [], f"nextpnr-{self.name} " + " ".join(params) + " -q")
-            self.job.run()
-        else:
-            click.secho('Executable for {} not available, install'.format('nextpnr-' + self.name), fg="red")
-            sys.exit(-1)
-
-    def isUpdateNeeded(self, inputs, output):
-        latest = 0
-        for x in inputs:
-            latest = max(latest,os.stat(x).st_mtime)
-        need_update = True
-        if (os.path.exists(output)):
-            if latest < os.stat(output).st_mtime:
-                need_update = False
-        return need_update
-
-    def isConstraintGenNeeded(self, output):
-        return self.isUpdateNeeded([ self.project.getProjectFilename() ], os.path.join(self.work_dir,output))
-
-    def isSynthNeeded(self, output):
-        return self.isUpdateNeeded([ self.project.getProjectFilename() ] + self.project.getSourceFiles(), os.path.join(self.work_dir,output))
-
-    def isPnRNeeded(self, inputFile, output):
-        return self.isUpdateNeeded([ inputFile, self.getConstraintFile()], os.path.join(self.work_dir,output))
-
-    def executeSynth(self):
+    def writeScript(self, name, lines):
+        filename = os.path.join(self.work_dir, name)
+        content = "".join(line + "\n" for line in lines)
+        if not os.path.exists(filename) or open(filename).read() != content:
+            with open(filename, "w") as f:
+                f.write(content)
+        return filename
+
+    def executeYosys(self, scriptfile, inputs, outputs, deps=[]):
+        #if self.settings.get("verbose") != "True":
+        #params.append("-q")
+        return self.executeStep("synth", "synthesis", deps, [ scriptfile ] + inputs, outputs, f"yosys {scriptfile} -q", [ 'yosys' ])
+
+    def executeNextPnR(self, params, inputs, outputs, deps=[]):
+        #if self.settings.get("verbose") != "True":
+        #params.append("-q")
+        report = os.path.join(self.work_dir, 'report.json')
+        params = params + [ '--report', report ]
+        if self.seeds > 1:
+            sweep = FPGASeedSweepTask(self, "pnr", "place and route", deps, inputs, outputs + [ report ],
+                    f"nextpnr-{self.name} " + " ".join(params), [ 'nextpnr-' + self.name ], params, self.seeds)
+            return sweep.select
+        return self.executeStep("pnr", "place and route", deps, inputs, outputs + [ report ], f"nextpnr-{self.name} " + " ".join(params) + " -q", [ 'nextpnr-' + self.name ])
+
+    def executeReport(self, deps=[]):
+        return FPGAReportTask(self, deps, os.path.join(self.work_dir, 'report.json'))
+
+    def isUpdateNeeded(self, step, key, outputs):
+        return not self.manifest.is_up_to_date(step, key, outputs)
+
+    def executeStep(self, step, description, deps, inputs, outputs, cmdline, tools):
+        return FPGAStepTask(self, step, description, deps, inputs, outputs, cmdline, tools)
+
+    def prepareStep(self, task):
+        try:
+            task.key = self.manifest.step_key(task.info, task.inputs, task.signature, task.tools)
+        except OSError as e:
+            self.job.error("{}: missing input {}".format(click.style(task.info, fg="magenta"), e.filename), self.configuration)
+            return False
+        if not self.isUpdateNeeded(task.info, task.key, task.outputs):
+            self.job.log(click.style(task.info, fg="magenta") + ": No need for {} step".format(task.description), self.configuration)
+            return False
+        self.manifest.forget(task.info)
+        if self.restoreStep(task.info, task.key, task.outputs):
+            return False
+        for tool in task.tools:
+            if not which(tool):
+                self.job.error("{}: Executable for {} not available, install".format(click.style(task.info, fg="magenta"), tool), self.configuration)
+                return False
+        for x in task.outputs:
+            if os.path.lexists(x):
+                os.remove(x)
+        return True
+
+    def finishStep(self, task):
+        digests = self.manifest.record(task.info, task.key, task.outputs)
+        if self.cache is not None:
+            self.cache.store(task.key, task.outputs, digests)
+
+    def restoreStep(self, step, key, outputs):
+        if self.cache is None:
+            return False
+        entry = self.cache.lookup(key)
+        if entry is None or not self.cache.restore(entry, outputs):
+            return False
+        self.job.log(click.style(step, fg="magenta") + ": Restored outputs from cache", self.configuration)
+        self.manifest.record(step, key, outputs)
+        return True
+
+    def executeSynth(self, deps=[]):
         raise NotImplementedError
 
-    def executePnR(self):
+    def executePnR(self, deps=[]):
         raise NotImplementedError
 
-    def executePack(self):
+    def executePack(self, deps=[]):
         raise NotImplementedError
 
     def executeUpload(self, variant, programmer):
@@ -131,15 +329,32 @@ class BaseArchitecture():
     def executeFlash(self, variant, programmer):
         raise NotImplementedError
 
-    def executeBuild(self):
+    def scheduleBuild(self):
         os.makedirs(self.work_dir, exist_ok=True)
-        if self.validateProject():
+        if not self.validateProject():
+            self.job.error("", self.configuration)
+            return None
+        if not self.project.getConstraintFiles():
+            self.job.error("No constraint file found for {}".format(self.name), self.configuration)
+            return None
+        # The whole flow is one DAG; report parsing overlaps with packing
+        # and with every other configuration sharing the job.
+        synth = self.executeSynth()
+        pnr = self.executePnR([ synth ])
+        self.executeReport([ pnr ])
+        return self.executePack([ pnr ])
+
+    def finishBuild(self):
+        if self.cache is not None and self.cache.flush():
+            self.job.warning("Some artifacts could not be uploaded to the remote cache")
+
+    def executeBuild(self):
+        if self.scheduleBuild() is not None:
             try:
-                self.executeSynth()
-                self.executePnR()
-                self.executePack()
+                self.job.run()
             except FPGAAbort:
                 pass
+            self.finishBuild()
             self.job.final()
 
     def executeClean(self):
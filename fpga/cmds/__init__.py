@@ -1,61 +1,130 @@
 import os
+import sys
+import marshal
+from time import perf_counter
 import click
+from click.utils import make_default_short_help
+from fpga import __version__
+from fpga.util.dirs import get_cache_directory, get_daemon_socket
+
+INDEX_VERSION = 1
+
+def get_index_filename():
+    return os.path.join(get_cache_directory(), "cmdindex-{}.marshal".format(__version__))
+
+def index_stamp(cmds_dir, files):
+    # Directory mtimes catch added and removed commands, file mtimes
+    # catch edited help texts; nothing is listed or imported.
+    stamp = []
+    for name in [ "" ] + files:
+        try:
+            stamp.append(os.stat(os.path.join(cmds_dir, name)).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+def build_index(cmds_dir):
+    commands = dict()
+    files = []
+    for group in sorted(os.listdir(cmds_dir)):
+        path = os.path.join(cmds_dir, group)
+        if group.startswith("__") or not os.path.isdir(path):
+            continue
+        files.append(group)
+        for cmd_name in sorted(os.listdir(path)):
+            if cmd_name.startswith("__init__") or not cmd_name.endswith(".py"):
+                continue
+            files.append(os.path.join(group, cmd_name))
+            cmd = __import__("fpga.cmds." + group + "." + cmd_name[:-3], None, None, ["cli"]).cli
+            commands[cmd_name[:-3]] = (group, cmd.short_help, cmd.help, cmd.hidden)
+    return {
+        "index" : INDEX_VERSION,
+        "version" : __version__,
+        "files" : files,
+        "stamp" : index_stamp(cmds_dir, files),
+        "commands" : commands,
+    }
+
+def load_index(cmds_dir):
+    filename = get_index_filename()
+    try:
+        with open(filename, "rb") as f:
+            index = marshal.loads(f.read())
+        if index["index"] == INDEX_VERSION and index["version"] == __version__ and \
+                index["stamp"] == index_stamp(cmds_dir, index["files"]):
+            return index
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+    index = build_index(cmds_dir)
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpname = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmpname, "wb") as f:
+            marshal.dump(index, f)
+        os.replace(tmpname, filename)
+    except OSError:
+        pass
+    return index
 
 class FPGACLI(click.MultiCommand):
 
     def __init__(self, *args, **kwargs):
         super(FPGACLI, self).__init__(*args, **kwargs)
         self._cmds_dir = os.path.dirname(__file__)
-        self._groups = []
-        self._cmd_map = dict()
         self._group_map = dict()
-        self._group_map["project"] = "Project commands:"
-        self._group_map["setup"] = "Setup commands:"
-        self._group_map["util"] = "Utility commands:"
-        for group in os.listdir(self._cmds_dir):
-            if group.startswith("__pycache__"):
-                continue
-            path = os.path.join(self._cmds_dir, group)
-            if os.path.isdir(path):
-                self._groups.append(group)
-        self._groups.sort()
-        self.list_commands(None)
+        self._group_map["project"] = "Project commands"
+        self._group_map["setup"] = "Setup commands"
+        self._group_map["util"] = "Utility commands"
+        self._index = None
+        self.index_time = None
+        self.command_time = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            start = perf_counter()
+            self._index = load_index(self._cmds_dir)
+            self.index_time = perf_counter() - start
+        return self._index
+
+    def main(self, args=None, prog_name=None, **kwargs):
+        if args is None:
+            args = sys.argv[1:]
+        # With a daemon running, commands are executed by it; the socket
+        # check keeps this free when there is none.
+        if args and args[0] in self.index["commands"] and args[0] != "daemon" and \
+                not os.environ.get("FPGA_NO_DAEMON") and os.path.exists(get_daemon_socket()):
+            from fpga.util.daemon import forward
+            code = forward(args)
+            if code is not None:
+                sys.exit(code)
+        return super().main(args, prog_name, **kwargs)
 
     def list_commands(self, ctx):
-        cmds = []
-        for group_name in self._groups:
-            path = os.path.join(self._cmds_dir, group_name)
-            for cmd_name in os.listdir(path):
-                if cmd_name.startswith("__init__"):
-                    continue
-                if cmd_name.endswith(".py"):
-                    cmds.append(cmd_name[:-3])
-                    self._cmd_map[cmd_name[:-3]] = group_name
-        cmds.sort()
-        return cmds
+        return sorted(self.index["commands"])
 
     def get_command(self, ctx, cmd_name):
-        mod = None
-        try:
-            mod = __import__("fpga.cmds." + self._cmd_map[cmd_name] + "." + cmd_name, None, None, ["cli"])
-        except:
-            raise click.UsageError('No such command "%s"' % cmd_name, ctx)
-        return mod.cli
-
-    def get_help(self, ctx):
-        formatter = ctx.make_formatter()
-        self.format_usage(ctx, formatter)
-        self.format_help_text(ctx, formatter)
-        click.Command.format_options(self, ctx, formatter)
-        cmd_formatter = ctx.make_formatter()
-        self.format_commands(ctx, cmd_formatter)
-        help_lines = cmd_formatter.getvalue().rstrip("\n").split("\n")[1:]
-        for group_name in self._groups:
-            formatter.write_paragraph()
-            formatter.write_text(self._group_map[group_name])
-            for line in help_lines:
-                if (self._cmd_map[line.strip().split()[0]] == group_name):
-                    formatter.write_text(line)
-
-        self.format_epilog(ctx, formatter)
-        return formatter.getvalue()
+        entry = self.index["commands"].get(cmd_name)
+        if entry is None:
+            return None
+        # Only the command that is run gets imported; errors in it are
+        # real errors and are not reported as an unknown command.
+        start = perf_counter()
+        cmd = __import__("fpga.cmds." + entry[0] + "." + cmd_name, None, None, ["cli"]).cli
+        self.command_time = perf_counter() - start
+        return cmd
+
+    def format_commands(self, ctx, formatter):
+        commands = [ (name, entry) for name, entry in sorted(self.index["commands"].items()) if not entry[3] ]
+        if not commands:
+            return
+        width = max(len(name) for name, entry in commands)
+        limit = formatter.width - 6 - width
+        groups = sorted(set(entry[0] for name, entry in commands))
+        for group_name in groups:
+            rows = []
+            for name, (group, short_help, help, hidden) in commands:
+                if group == group_name:
+                    rows.append((name.ljust(width), short_help or make_default_short_help(help or "", limit)))
+            with formatter.section(self._group_map.get(group_name, group_name.capitalize() + " commands")):
+                formatter.write_dl(rows)
@@ -1,9 +1,99 @@
+import os
+import sys
 import click
+from fpga.util import FPGAJob
 from fpga.util.project import Project
+from fpga.util.remote import DEFAULT_TIMEOUT
+from fpga.util.history import open_history
+
+def getConfigurations(ctx, boards, all_boards):
+    proj = Project("apio.ini", ctx)
+    configurations = [ proj.getConfiguration() ]
+    if all_boards:
+        configurations = proj.getBoards()
+    if boards:
+        configurations = [ x.strip() for x in boards.split(",") if x.strip() ]
+    return configurations
+
+def getWatchedFiles(projects):
+    files = [ "apio.ini" ]
+    for proj in projects:
+        files += proj.getSourceFiles() + proj.getConstraintFiles()
+    return files
+
+def cancelStale(job, changed):
+    # A changed input makes the tasks reading it, and everything after
+    # them, stale. Anything else (apio.ini, a new source) may change the
+    # flow itself, so all unfinished work is dropped.
+    stale = []
+    for task in job.tasks_all:
+        inputs = set(os.path.abspath(x) for x in getattr(task, "inputs", []))
+        if inputs & changed:
+            stale.append(task)
+    known = set()
+    for task in job.tasks_all:
+        known |= set(os.path.abspath(x) for x in getattr(task, "inputs", []))
+    if changed - known:
+        stale = list(job.tasks_all)
+    job.log("Changed: {}, cancelling stale steps".format(", ".join(sorted(os.path.relpath(x) for x in changed))))
+    job.cancel(stale)
+
+def runBuild(ctx, configurations, jobs, quiet, history, watcher=None):
+    job = FPGAJob([], [], [], configurations[0] if len(configurations) == 1 else None, max_tasks=jobs,
+            quiet=quiet, history=history)
+    if history is not None:
+        history.warning = job.warning
+    projects = [ Project("apio.ini", ctx, x) for x in configurations ]
+    archs = [ x.getArchitecture(job) for x in projects ]
+    for arch in archs:
+        arch.scheduleBuild()
+    if watcher is not None:
+        watcher.update(getWatchedFiles(projects))
+        watcher.attach(job, lambda changed: cancelStale(job, changed))
+    job.run()
+    for arch in archs:
+        arch.finishBuild()
+    job.final()
+    job.close()
+    return job
+
+def watchBuild(ctx, boards, all_boards, jobs, quiet, history):
+    from fpga.util.watch import FileWatcher
+    watcher = FileWatcher([ "apio.ini" ])
+    click.secho("Watching for changes{}, press Ctrl+C to stop".format(" (polling)" if watcher.is_polling() else ""), fg="blue")
+    while True:
+        try:
+            runBuild(ctx, getConfigurations(ctx, boards, all_boards), jobs, quiet, history, watcher)
+        except SystemExit:
+            # A broken apio.ini or unknown board; wait for it to be fixed.
+            pass
+        changed = watcher.wait()
+        click.secho("Changed: {}, rebuilding".format(", ".join(sorted(os.path.relpath(x) for x in changed))), fg="blue")
 
 @click.command('build', help='Build FPGA project')
+@click.option('--boards', metavar='A,B,...', help='Comma separated list of boards to build.')
+@click.option('--all', 'all_boards', is_flag=True, help='Build every board listed in apio.ini.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), help='Maximum number of tools running at once.')
+@click.option('--seeds', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of nextpnr seeds to try in parallel.')
+@click.option('-q', '--quiet', is_flag=True, help='Only show tool output of failing steps.')
+@click.option('--tail', type=click.IntRange(min=1), default=50, show_default=True,
+              help='Lines of tool output kept per step in quiet mode.')
+@click.option('--no-cache', is_flag=True, help='Do not use the artifact cache.')
+@click.option('--remote-cache', metavar='URL', default=lambda: os.environ.get("FPGA_REMOTE_CACHE"),
+              help='HTTP build cache to query and populate (default: $FPGA_REMOTE_CACHE).')
+@click.option('--remote-timeout', type=float, default=DEFAULT_TIMEOUT, show_default=True,
+              help='Seconds to wait for the remote cache before building locally.')
+@click.option('--no-history', is_flag=True, help='Do not record this build in the history database.')
+@click.option('-w', '--watch', is_flag=True, help='Rebuild whenever sources, constraints or apio.ini change.')
 @click.pass_context
-def cli(ctx):
-    proj = Project("apio.ini", ctx)
-    arch = proj.getArchitecture()
-    arch.executeBuild()
+def cli(ctx, boards, all_boards, jobs, seeds, quiet, tail, no_cache, remote_cache, remote_timeout, no_history, watch):
+    ctx.obj["seeds"] = seeds
+    ctx.obj["cache"] = not no_cache
+    ctx.obj["remote_cache"] = remote_cache
+    ctx.obj["remote_timeout"] = remote_timeout
+    history = None if no_history else open_history()
+    if watch:
+        watchBuild(ctx, boards, all_boards, jobs, tail if quiet else None, history)
+    job = runBuild(ctx, getConfigurations(ctx, boards, all_boards), jobs, tail if quiet else None, history)
+    sys.exit(job.retcode)
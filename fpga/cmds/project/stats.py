@@ -0,0 +1,109 @@
+import click
+from datetime import datetime
+from time import time, localtime
+from fpga.util.history import BuildHistory, median, HISTORY_WINDOW
+from fpga.util.job import format_duration, format_rss
+
+MIN_SAMPLES = 3
+
+def format_metric(name, value):
+    if value is None:
+        return "-"
+    if name.startswith("fmax."):
+        return "{:.2f}".format(value)
+    return "{:d}".format(int(value))
+
+def regressions(history, configuration, run, steps, window, threshold):
+    flags = []
+    for step in steps:
+        if step["status"] != "OK":
+            continue
+        samples = history.step_samples(configuration, step["step"], run["started"], window)
+        if len(samples) < MIN_SAMPLES:
+            continue
+        wall = median([ x["wall"] for x in samples ])
+        if wall and step["wall"] > wall * (1 + threshold):
+            flags.append("{} slower: {} vs median {}".format(step["step"], format_duration(step["wall"]), format_duration(wall)))
+        rss = median([ x["max_rss"] for x in samples if x["max_rss"] ])
+        if rss and step["max_rss"] and step["max_rss"] > rss * (1 + threshold):
+            flags.append("{} hungrier: {} vs median {}".format(step["step"], format_rss(step["max_rss"]), format_rss(rss)))
+    return flags
+
+def show_configuration(history, configuration, last, window, threshold):
+    runs = history.runs(configuration, last)
+    if not runs:
+        return
+    rows = []
+    step_names = []
+    metric_names = []
+    for run in runs:
+        steps = history.steps(run["id"])
+        metrics = history.metrics(run["id"])
+        for step in steps:
+            if step["status"] == "OK" and step["step"] not in step_names:
+                step_names.append(step["step"])
+        for name in sorted(metrics):
+            if name not in metric_names:
+                metric_names.append(name)
+        rows.append((run, { x["step"] : x for x in steps }, metrics, regressions(history, configuration, run, steps, window, threshold)))
+
+    header = [ "date", "status", "wall" ] + step_names + [ x.split(".", 1)[1] for x in metric_names ]
+    table = []
+    for run, steps, metrics, flags in rows:
+        line = [ datetime.fromtimestamp(run["started"]).strftime("%Y-%m-%d %H:%M"), run["status"],
+                format_duration(run["wall"]) if run["wall"] is not None else "-" ]
+        for name in step_names:
+            step = steps.get(name)
+            if step is None:
+                line.append("-")
+            elif step["status"] == "OK":
+                line.append(format_duration(step["wall"]) + ("*" if any(x.startswith(name + " ") for x in flags) else ""))
+            else:
+                line.append(step["status"].lower())
+        line += [ format_metric(name, metrics.get(name)) for name in metric_names ]
+        table.append((line, flags))
+
+    widths = [ max([ len(header[i]) ] + [ len(line[i]) for line, flags in table ]) for i in range(len(header)) ]
+    click.secho("{} ({} runs)".format(configuration, len(runs)), fg="blue", bold=True)
+    click.echo("  " + "  ".join(x.ljust(w) for x, w in zip(header, widths)).rstrip())
+    for line, flags in table:
+        click.echo("  " + "  ".join(x.ljust(w) for x, w in zip(line, widths)).rstrip())
+        for flag in flags:
+            click.secho("      ! " + flag, fg="yellow")
+
+def show_running(history):
+    running = history.running()
+    if not running:
+        return
+    click.secho("Running", fg="blue", bold=True)
+    now = time()
+    for run, step in running:
+        elapsed = now - step["started"]
+        line = "  {} {}: running for {}".format(run["configuration"], step["step"], format_duration(elapsed))
+        eta = history.estimate(run["configuration"], step["step"])
+        if eta is not None:
+            if eta > elapsed:
+                line += ", about {} left (ETA {:02d}:{:02d}:{:02d})".format(format_duration(eta - elapsed), *localtime(step["started"] + eta)[3:6])
+            else:
+                line += ", overdue (usually {})".format(format_duration(eta))
+        click.echo(line)
+
+@click.command('stats', help='Show build history and performance trends.')
+@click.option('--boards', metavar='A,B,...', help='Comma separated list of boards to show.')
+@click.option('-n', '--last', type=click.IntRange(min=1), default=20, show_default=True, help='Number of builds to show.')
+@click.option('--window', type=click.IntRange(min=1), default=HISTORY_WINDOW, show_default=True,
+              help='Number of previous builds the rolling median covers.')
+@click.option('--threshold', type=click.IntRange(min=0), default=20, show_default=True,
+              help='Percent above the median that counts as a regression.')
+@click.pass_context
+def cli(ctx, boards, last, window, threshold):
+    history = BuildHistory()
+    configurations = history.configurations()
+    if boards:
+        configurations = [ x.strip() for x in boards.split(",") if x.strip() in configurations ]
+    if not configurations:
+        click.echo("No builds recorded for this project")
+    for configuration in configurations:
+        show_configuration(history, configuration, last, window, threshold / 100)
+    show_running(history)
+    history.close()
@@ -1,6 +1,29 @@
+import json
 import click
+from fpga.util.database import getBoardDatabase
 
 @click.command('boards', help='Manage FPGA boards.')
+@click.argument('pattern', required=False)
+@click.option('--arch', help='Only boards of this architecture.')
+@click.option('--device', help='Only boards with this device (e.g. hx1k, 25k).')
+@click.option('--programmer', help='Only boards using this programmer.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the matching boards as JSON.')
 @click.pass_context
-def cli(ctx):
-    pass
\ No newline at end of file
+def cli(ctx, pattern, arch, device, programmer, as_json):
+    db = getBoardDatabase()
+    boards = db.findBoards(pattern, arch, device, programmer)
+    if as_json:
+        click.echo(json.dumps(dict(boards), indent=2, sort_keys=True))
+        return
+    if not boards:
+        click.echo("No matching boards")
+        return
+    rows = [ ("Board", "Arch", "Device", "Package", "Programmer", "Name") ]
+    for name, board in boards:
+        rows.append((name, board.get("arch", "?"), board.get("device", "?"), board.get("package", "?"),
+                board.get("programmer", {}).get("type", "-"), board.get("name", "")))
+    widths = [ max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1) ]
+    for i, row in enumerate(rows):
+        line = "  ".join(x.ljust(w) for x, w in zip(row, widths)) + "  " + row[-1]
+        click.secho(line, bold=(i == 0))
+    click.echo("{} boards".format(len(boards)))
@@ -0,0 +1,39 @@
+import os
+import click
+from fpga.util.cache import ArtifactCache, get_cache_directory, parse_size, format_size
+from fpga.util.cacheserver import CacheServer
+
+@click.group('cache', help='Manage the build artifact cache.')
+@click.pass_context
+def cli(ctx):
+    pass
+
+@cli.command('stats', help='Show artifact cache usage.')
+def stats():
+    cache = ArtifactCache()
+    data = cache.stats()
+    click.echo("Location : {}".format(cache.root))
+    click.echo("Entries  : {}".format(data["entries"]))
+    click.echo("Objects  : {}".format(data["objects"]))
+    click.echo("Size     : {} of {}".format(format_size(data["size"]), format_size(data["max_size"])))
+
+@cli.command('gc', help='Evict least recently used artifacts.')
+@click.option('--max-size', help='Size to shrink the cache to (e.g. 500M, 2G).')
+def gc(max_size):
+    cache = ArtifactCache()
+    removed = cache.gc(parse_size(max_size) if max_size else None)
+    click.echo("Removed {}".format(format_size(removed)))
+
+@cli.command('serve', help='Run a reference remote cache server.')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Address to listen on.')
+@click.option('--port', type=int, default=8080, show_default=True, help='Port to listen on.')
+@click.option('--root', type=click.Path(file_okay=False), help='Storage directory (default: <cache>/server).')
+@click.option('--verbose', is_flag=True, help='Log every request.')
+def serve(host, port, root, verbose):
+    server = CacheServer(root or os.path.join(get_cache_directory(), "server"), host, port, verbose=verbose)
+    click.echo("Serving build cache on http://{}:{}/".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
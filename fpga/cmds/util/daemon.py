@@ -0,0 +1,77 @@
+import os
+import sys
+import signal
+import socket
+import click
+from datetime import datetime
+from fpga.util.dirs import get_cache_directory, get_daemon_socket
+
+def supported():
+    if not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"):
+        click.secho("The build daemon is not supported on this platform", fg="red")
+        sys.exit(1)
+
+@click.group('daemon', help='Keep a warm build server running in the background.')
+@click.pass_context
+def cli(ctx):
+    supported()
+
+@cli.command('start', help='Start the daemon.')
+@click.option('--foreground', is_flag=True, help='Do not detach, log to the terminal.')
+@click.option('--socket', 'path', type=click.Path(dir_okay=False), help='Socket to listen on.')
+def start(foreground, path):
+    from fpga.util.daemon import Daemon, DaemonError
+    path = path or get_daemon_socket()
+    def log(msg):
+        click.echo("{} fpga daemon: {}".format(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), msg))
+        sys.stdout.flush()
+    daemon = Daemon(path, log)
+    try:
+        daemon.bind()
+    except (DaemonError, OSError) as e:
+        click.secho(str(e), fg="red")
+        sys.exit(1)
+    if not foreground:
+        logname = os.path.join(get_cache_directory(), "daemon.log")
+        if os.fork() != 0:
+            click.echo("Daemon started, listening on {} (log in {})".format(path, logname))
+            os._exit(0)
+        os.setsid()
+        if os.fork() != 0:
+            os._exit(0)
+        os.makedirs(os.path.dirname(logname), exist_ok=True)
+        fd = os.open(logname, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        null = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null, 0)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+        os.close(null)
+    def stop(signum, frame):
+        daemon.running = False
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    daemon.serve()
+
+@cli.command('stop', help='Stop the daemon.')
+def stop():
+    from fpga.util.daemon import request, DaemonError
+    try:
+        request({ "type" : "stop" })
+    except (OSError, DaemonError, ValueError):
+        click.echo("Daemon is not running")
+        return
+    click.echo("Daemon stopped")
+
+@cli.command('status', help='Show whether the daemon is running.')
+def status():
+    from fpga.util.daemon import request, DaemonError
+    try:
+        reply = request({ "type" : "status" })
+    except (OSError, DaemonError, ValueError):
+        click.echo("Daemon is not running")
+        sys.exit(1)
+    click.echo("Daemon running, pid {}, version {}".format(reply["pid"], reply["version"]))
+    click.echo("Socket   : {}".format(reply["socket"]))
+    click.echo("Uptime   : {:.0f}s".format(reply["uptime"]))
+    click.echo("Requests : {}".format(reply["requests"]))
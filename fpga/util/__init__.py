@@ -1,7 +1,22 @@
 import os
 
-from .log import log
-from .job import hook_signals, FPGAJob, FPGATask, FPGAAbort
+# Submodules are imported on first use, so commands that never run a
+# job do not pay for subprocess, selectors and sqlite3 at startup.
+_lazy = {
+    "log" : ".log",
+    "hook_signals" : ".job",
+    "FPGAJob" : ".job",
+    "FPGATask" : ".job",
+    "FPGAAbort" : ".job",
+}
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    mod = __import__(__name__ + _lazy[name], None, None, [name])
+    value = getattr(mod, name)
+    globals()[name] = value
+    return value
 
 def get_directory(name):
     return os.path.join(os.path.dirname(__file__), '..', name)
@@ -0,0 +1,215 @@
+import os
+import json
+import shutil
+from fpga.util.manifest import hash_file
+from fpga.util.dirs import get_cache_directory
+if os.name == "posix":
+    import fcntl
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024
+
+# FICLONE ioctl from linux/fs.h, used for copy-on-write clones.
+FICLONE = 0x40049409
+
+size_units = {
+    "" : 1,
+    "K" : 1024,
+    "M" : 1024 * 1024,
+    "G" : 1024 * 1024 * 1024,
+    "T" : 1024 * 1024 * 1024 * 1024,
+}
+
+def parse_size(text):
+    text = str(text).strip().upper().rstrip("B")
+    unit = text[-1:] if text[-1:] in size_units else ""
+    return int(float(text[:len(text) - len(unit)]) * size_units[unit])
+
+def format_size(size):
+    for unit in ("", "K", "M", "G"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "T"
+    return "{:.1f}{}B".format(size, unit) if unit else "{}B".format(size)
+
+def get_cache_max_size():
+    if os.environ.get("FPGA_CACHE_MAX_SIZE"):
+        return parse_size(os.environ["FPGA_CACHE_MAX_SIZE"])
+    return DEFAULT_MAX_SIZE
+
+def reflink(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    if os.name == "posix":
+        try:
+            reflink(src, dst)
+            return
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+    shutil.copyfile(src, dst)
+
+class ArtifactCache:
+    def __init__(self, root=None, max_size=None, remote=None):
+        self.root = root or get_cache_directory()
+        self.max_size = max_size or get_cache_max_size()
+        self.remote = remote
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.entries_dir = os.path.join(self.root, "entries")
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def entry_path(self, key):
+        return os.path.join(self.entries_dir, key[:2], key[2:] + ".json")
+
+    def lookup(self, key):
+        filename = self.entry_path(key)
+        try:
+            with open(filename) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return self.lookup_remote(key)
+        for item in entry["outputs"].values():
+            if not os.path.exists(self.object_path(item["sha256"])):
+                return self.lookup_remote(key)
+        os.utime(filename)
+        return entry
+
+    def lookup_remote(self, key):
+        if self.remote is None:
+            return None
+        entry = self.remote.get_entry(key)
+        if entry is None:
+            return None
+        for item in entry["outputs"].values():
+            path = self.object_path(item["sha256"])
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not self.remote.fetch(item["sha256"], path):
+                return None
+        self.write_entry(key, entry)
+        return entry
+
+    def restore(self, entry, outputs):
+        for x in outputs:
+            item = entry["outputs"].get(os.path.basename(x))
+            if item is None:
+                return False
+            if os.path.lexists(x):
+                os.remove(x)
+            link_or_copy(self.object_path(item["sha256"]), x)
+        return True
+
+    def add_object(self, filename, digest):
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpname = "{}.{}.tmp".format(path, os.getpid())
+        link_or_copy(filename, tmpname)
+        os.chmod(tmpname, 0o444)
+        os.replace(tmpname, path)
+
+    def write_entry(self, key, entry):
+        filename = self.entry_path(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpname = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmpname, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmpname, filename)
+
+    def store(self, key, outputs, digests=None):
+        entry = { "outputs" : {} }
+        for x in outputs:
+            digest = digests[x] if digests else hash_file(x)
+            self.add_object(x, digest)
+            entry["outputs"][os.path.basename(x)] = { "sha256" : digest, "size" : os.path.getsize(x) }
+        self.write_entry(key, entry)
+        if self.remote is not None:
+            self.remote.upload(key, entry, { item["sha256"] : self.object_path(item["sha256"]) for item in entry["outputs"].values() })
+        if self.stats()["size"] > self.max_size:
+            self.gc()
+        return entry
+
+    def flush(self):
+        if self.remote is None:
+            return 0
+        return self.remote.flush()
+
+    def list_entries(self):
+        entries = []
+        if not os.path.isdir(self.entries_dir):
+            return entries
+        for sub in os.scandir(self.entries_dir):
+            if not sub.is_dir():
+                continue
+            for item in os.scandir(sub.path):
+                if item.name.endswith(".json"):
+                    entries.append((item.stat().st_mtime, item.path))
+        return entries
+
+    def list_objects(self):
+        objects = dict()
+        if not os.path.isdir(self.objects_dir):
+            return objects
+        for sub in os.scandir(self.objects_dir):
+            if not sub.is_dir():
+                continue
+            for item in os.scandir(sub.path):
+                if not item.name.endswith(".tmp"):
+                    objects[sub.name + item.name] = item.stat().st_size
+        return objects
+
+    def stats(self):
+        objects = self.list_objects()
+        return {
+            "entries" : len(self.list_entries()),
+            "objects" : len(objects),
+            "size" : sum(objects.values()),
+            "max_size" : self.max_size,
+        }
+
+    def gc(self, max_size=None):
+        if max_size is None:
+            max_size = self.max_size
+        objects = self.list_objects()
+        referenced = dict()
+        total = 0
+        full = False
+        # Newest entries first; once the cap is hit everything older is evicted.
+        for mtime, filename in sorted(self.list_entries(), reverse=True):
+            entry = None
+            if not full:
+                try:
+                    with open(filename) as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    pass
+            if entry is None:
+                os.remove(filename)
+                continue
+            digests = set(item["sha256"] for item in entry["outputs"].values()) - set(referenced)
+            size = sum(objects.get(x, 0) for x in digests)
+            if total + size > max_size:
+                full = True
+                os.remove(filename)
+                continue
+            total += size
+            for x in digests:
+                referenced[x] = True
+        removed = 0
+        for digest, size in objects.items():
+            if digest not in referenced:
+                os.remove(self.object_path(digest))
+                removed += size
+        return removed
@@ -0,0 +1,105 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fpga.util.cache import ArtifactCache
+
+path_regex = re.compile(r"^/(ac|cas)/([0-9a-f]{64})$")
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def resolve(self):
+        m = path_regex.match(self.path)
+        if m is None:
+            return None, None
+        kind, digest = m.groups()
+        if kind == "ac":
+            return kind, self.server.store.entry_path(digest)
+        return kind, self.server.store.object_path(digest)
+
+    def reply(self, code, body=b""):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_file(self, filename):
+        try:
+            f = open(filename, "rb")
+        except OSError:
+            self.reply(404)
+            return
+        with f:
+            os.utime(filename)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            if self.command != "HEAD":
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    self.wfile.write(block)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        kind, filename = self.resolve()
+        if filename is None:
+            self.reply(400)
+            return
+        self.send_file(filename)
+
+    def do_PUT(self):
+        kind, filename = self.resolve()
+        length = int(self.headers.get("Content-Length", 0))
+        if filename is None:
+            self.rfile.read(length)
+            self.reply(400)
+            return
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # Concurrent uploads of the same object each write a private
+        # temporary file; the atomic rename makes the last one win.
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+        try:
+            h = hashlib.sha256()
+            with os.fdopen(fd, "wb") as f:
+                while length > 0:
+                    block = self.rfile.read(min(length, 1 << 20))
+                    if not block:
+                        break
+                    length -= len(block)
+                    h.update(block)
+                    f.write(block)
+            if length > 0:
+                raise ValueError("truncated upload")
+            if kind == "cas" and h.hexdigest() != self.path.rsplit("/", 1)[1]:
+                raise ValueError("content does not match digest")
+            if kind == "ac":
+                with open(tmpname) as f:
+                    json.load(f)
+            os.chmod(tmpname, 0o444)
+            os.replace(tmpname, filename)
+        except ValueError as e:
+            os.remove(tmpname)
+            self.reply(400, str(e).encode("utf-8"))
+            return
+        self.reply(201)
+
+class CacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root, host="127.0.0.1", port=8080, max_size=None, verbose=False):
+        self.store = ArtifactCache(root, max_size)
+        self.verbose = verbose
+        super().__init__((host, port), CacheRequestHandler)
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import array
+import atexit
+import signal
+import socket
+import struct
+from time import time
+from fpga import __version__
+from fpga.util.dirs import get_daemon_socket
+
+PROTOCOL_VERSION = 1
+ACCEPT_TIMEOUT = 1.0
+
+# Tools looked up ahead of time so forked requests find them cached.
+warm_tools = [ "yosys", "nextpnr-ice40", "nextpnr-ecp5", "icepack", "ecppack" ]
+
+length_header = struct.Struct("!I")
+
+class DaemonError(Exception):
+    pass
+
+def send_message(sock, message, fds=None):
+    data = json.dumps(message).encode("utf-8")
+    data = length_header.pack(len(data)) + data
+    if fds:
+        sock.sendmsg([ data ], [ (socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds)) ])
+    else:
+        sock.sendall(data)
+
+def recv_exactly(sock, size, fds=None):
+    data = b""
+    while len(data) < size:
+        if fds is not None and not data:
+            chunk, ancdata, flags, addr = sock.recvmsg(size, socket.CMSG_LEN(16 * array.array("i").itemsize))
+            for level, kind, cmsg in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    received = array.array("i")
+                    received.frombytes(cmsg[:len(cmsg) - (len(cmsg) % received.itemsize)])
+                    fds.extend(received)
+        else:
+            chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise DaemonError("connection closed")
+        data += chunk
+    return data
+
+def recv_message(sock, fds=None):
+    header = recv_exactly(sock, length_header.size, fds)
+    return json.loads(recv_exactly(sock, length_header.unpack(header)[0]).decode("utf-8"))
+
+def connect(path=None, timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path or get_daemon_socket())
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def request(message, path=None, timeout=5.0):
+    sock = connect(path, timeout)
+    with sock:
+        send_message(sock, message)
+        return recv_message(sock)
+
+def forward(args):
+    # Runs a command inside the daemon with this process' stdio. Returns
+    # None when there is no usable daemon, so the caller runs it locally.
+    try:
+        sock = connect(timeout=5.0)
+    except OSError:
+        return None
+    with sock:
+        try:
+            send_message(sock, {
+                "type" : "run",
+                "protocol" : PROTOCOL_VERSION,
+                "version" : __version__,
+                "argv" : args,
+                "cwd" : os.getcwd(),
+                "env" : dict(os.environ),
+            }, [ 0, 1, 2 ])
+            reply = recv_message(sock)
+        except (OSError, DaemonError, ValueError):
+            return None
+        if "pid" not in reply:
+            return None
+        # The request runs in a process outside our process group, so
+        # terminal signals have to be passed on by hand.
+        pid = reply["pid"]
+        def relay(signum, frame):
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, relay)
+        sock.settimeout(None)
+        try:
+            reply = recv_message(sock)
+        except (OSError, DaemonError, ValueError):
+            return 1
+        return reply.get("exit", 1)
+
+def warm_up():
+    # Everything imported or loaded here is inherited by every forked
+    # request for free.
+    from fpga.__main__ import cli
+    from fpga.util.database import getBoardDatabase
+    from fpga.util.tools import which
+    import fpga.util.job, fpga.util.project, fpga.util.history, fpga.util.cache, fpga.util.remote
+    for name in cli.list_commands(None):
+        cli.get_command(None, name)
+    getBoardDatabase()
+    for tool in warm_tools:
+        which(tool)
+    return cli
+
+def exit_code(e):
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    sys.stderr.write("{}\n".format(e.code))
+    return 1
+
+class Daemon:
+    def __init__(self, path=None, log=None):
+        self.path = path or get_daemon_socket()
+        self.log = log or (lambda msg: None)
+        self.started = time()
+        self.requests = 0
+        self.running = True
+        self.cli = None
+        self.sock = None
+
+    def bind(self):
+        try:
+            with connect(self.path, 1.0):
+                raise DaemonError("a daemon is already listening on {}".format(self.path))
+        except OSError:
+            pass
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(16)
+        self.sock.settimeout(ACCEPT_TIMEOUT)
+
+    def serve(self):
+        self.cli = warm_up()
+        self.log("listening on {} (pid {})".format(self.path, os.getpid()))
+        try:
+            while self.running:
+                self.reap()
+                try:
+                    conn, addr = self.sock.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    conn.settimeout(None)
+                    self.handle(conn)
+        finally:
+            self.sock.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.log("stopped")
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+    def handle(self, conn):
+        fds = []
+        try:
+            message = recv_message(conn, fds)
+        except (OSError, DaemonError, ValueError):
+            for fd in fds:
+                os.close(fd)
+            return
+        kind = message.get("type")
+        if kind == "status":
+            send_message(conn, { "pid" : os.getpid(), "version" : __version__, "uptime" : time() - self.started,
+                    "requests" : self.requests, "socket" : self.path })
+        elif kind == "stop":
+            self.running = False
+            send_message(conn, { "stopped" : True })
+        elif kind == "run" and len(fds) == 3:
+            if message.get("protocol") != PROTOCOL_VERSION or message.get("version") != __version__:
+                send_message(conn, { "error" : "version mismatch, daemon runs {}".format(__version__) })
+            else:
+                from fpga.util.database import refreshBoardDatabase
+                refreshBoardDatabase()
+                self.requests += 1
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    self.sock.close()
+                    self.run_child(conn, message, fds)
+        else:
+            send_message(conn, { "error" : "bad request" })
+        for fd in fds:
+            os.close(fd)
+
+    def run_child(self, conn, message, fds):
+        code = 1
+        try:
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+            os.chdir(message["cwd"])
+            os.environ.clear()
+            os.environ.update(message["env"])
+            sys.argv = [ "fpga" ] + message["argv"]
+            send_message(conn, { "pid" : os.getpid() })
+            try:
+                self.cli.main(args=message["argv"], prog_name="fpga")
+                code = 0
+            except SystemExit as e:
+                code = exit_code(e)
+            except KeyboardInterrupt:
+                code = 130
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            send_message(conn, { "exit" : code })
+        except BaseException as e:
+            try:
+                sys.stderr.write("fpga daemon: {}\n".format(e))
+                send_message(conn, { "exit" : code })
+            except BaseException:
+                pass
+        finally:
+            os._exit(0)
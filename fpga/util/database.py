@@ -0,0 +1,145 @@
+import os
+import json
+import marshal
+import fnmatch
+from fpga import __version__
+from fpga.util import get_directory
+from fpga.util.dirs import get_cache_directory
+
+DATABASE_VERSION = 1
+
+def get_database_filename():
+    return os.path.join(get_cache_directory(), "boards-{}.marshal".format(__version__))
+
+def source_files():
+    data_dir = get_directory('data')
+    arch_dir = os.path.join(data_dir, 'arch')
+    files = [ os.path.join(data_dir, 'apio', 'boards.json'), os.path.join(data_dir, 'apio', 'fpgas.json'), arch_dir ]
+    for name in sorted(os.listdir(arch_dir)):
+        if name.endswith(".json"):
+            files.append(os.path.join(arch_dir, name))
+    return files
+
+def source_stamp(files):
+    stamp = []
+    for filename in files:
+        try:
+            st = os.stat(filename)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+def getDeviceName(fpga):
+    if fpga["arch"] == "ice40":
+        return fpga["type"] + fpga["size"]
+    return fpga["type"]
+
+def compileDatabase(files):
+    data_dir = get_directory('data')
+    with open(os.path.join(data_dir, 'apio', 'boards.json')) as f:
+        boards = json.load(f)
+    with open(os.path.join(data_dir, 'apio', 'fpgas.json')) as f:
+        fpgas = json.load(f)
+    devices = dict()
+    for filename in files[3:]:
+        arch = os.path.basename(filename)[:-5]
+        with open(filename) as f:
+            for item in json.load(f):
+                devices[(arch, item["device"])] = { "name" : item["name"], "packages" : set(item["packages"]) }
+    # Boards carry their resolved architecture, device and package so
+    # lookups never have to go through the fpga table again.
+    for board in boards.values():
+        fpga = fpgas.get(board.get("fpga"))
+        if fpga is not None:
+            board["arch"] = fpga["arch"]
+            board["device"] = getDeviceName(fpga)
+            board["package"] = fpga["pack"]
+    return {
+        "version" : DATABASE_VERSION,
+        "files" : files,
+        "stamp" : source_stamp(files),
+        "boards" : boards,
+        "fpgas" : fpgas,
+        "devices" : devices,
+    }
+
+def loadDatabase():
+    filename = get_database_filename()
+    try:
+        with open(filename, "rb") as f:
+            data = marshal.loads(f.read())
+        if data["version"] == DATABASE_VERSION and data["stamp"] == source_stamp(data["files"]):
+            return data
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+    data = compileDatabase(source_files())
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpname = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmpname, "wb") as f:
+            marshal.dump(data, f)
+        os.replace(tmpname, filename)
+    except OSError:
+        pass
+    return data
+
+class BoardDatabase():
+    def __init__(self, data):
+        self.files = data["files"]
+        self.stamp = data["stamp"]
+        self.boards = data["boards"]
+        self.fpgas = data["fpgas"]
+        self.devices = data["devices"]
+
+    def getBoard(self, name):
+        return self.boards.get(name)
+
+    def getFpga(self, name):
+        return self.fpgas.get(name)
+
+    def getDevice(self, arch, device):
+        return self.devices.get((arch, device))
+
+    def getArchitectures(self):
+        return sorted(set(arch for arch, device in self.devices))
+
+    def getDevices(self, arch):
+        return sorted(device for a, device in self.devices if a == arch)
+
+    def hasPackage(self, arch, device, package):
+        item = self.devices.get((arch, device))
+        return item is not None and package in item["packages"]
+
+    def findBoards(self, pattern=None, arch=None, device=None, programmer=None):
+        if pattern is not None and not any(c in pattern for c in "*?["):
+            pattern = "*" + pattern + "*"
+        result = []
+        for name, board in sorted(self.boards.items(), key=lambda x: x[0].lower()):
+            if arch is not None and board.get("arch") != arch:
+                continue
+            if device is not None and board.get("device") != device:
+                continue
+            if programmer is not None and board.get("programmer", {}).get("type") != programmer:
+                continue
+            if pattern is not None and not fnmatch.fnmatch(name.lower(), pattern.lower()) and \
+                    not fnmatch.fnmatch(board.get("name", "").lower(), pattern.lower()):
+                continue
+            result.append((name, board))
+        return result
+
+_database = None
+
+def getBoardDatabase():
+    global _database
+    if _database is None:
+        _database = BoardDatabase(loadDatabase())
+    return _database
+
+def refreshBoardDatabase():
+    # For long running processes: drop the loaded copy if the sources
+    # changed underneath it.
+    global _database
+    if _database is not None and _database.stamp != source_stamp(_database.files):
+        _database = None
+    return getBoardDatabase()
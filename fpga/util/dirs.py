@@ -0,0 +1,18 @@
+import os
+
+def get_cache_directory():
+    if os.environ.get("FPGA_CACHE_DIR"):
+        return os.environ["FPGA_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "fpga")
+
+def get_data_directory():
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "fpga")
+
+def get_daemon_socket():
+    if os.environ.get("FPGA_DAEMON_SOCKET"):
+        return os.environ["FPGA_DAEMON_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "fpga-daemon.sock")
+    return os.path.join(get_cache_directory(), "daemon.sock")
@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import hashlib
+from time import time
+from fpga.util.dirs import get_data_directory
+
+HISTORY_WINDOW = 5
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    configuration TEXT NOT NULL,
+    pid INTEGER,
+    started REAL NOT NULL,
+    wall REAL,
+    status TEXT NOT NULL,
+    input_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (project, configuration, started);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started REAL,
+    wall REAL,
+    utime REAL,
+    stime REAL,
+    max_rss INTEGER,
+    PRIMARY KEY (run_id, step)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, name)
+);
+"""
+
+def get_history_path():
+    if os.environ.get("FPGA_HISTORY_DB"):
+        return os.environ["FPGA_HISTORY_DB"]
+    return os.path.join(get_data_directory(), "history.db")
+
+def median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    n = len(values)
+    if n % 2:
+        return values[n // 2]
+    return (values[n // 2 - 1] + values[n // 2]) / 2
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, TypeError):
+        pass
+    return True
+
+class BuildHistory:
+    def __init__(self, filename=None, warning=None):
+        self.filename = filename or get_history_path()
+        self.warning = warning
+        self.disabled = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        self.db = sqlite3.connect(self.filename, timeout=10)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        with self.db:
+            self.db.executescript(schema)
+        self.project = os.getcwd()
+
+    def close(self):
+        self.db.close()
+
+    def write(self, statements):
+        # History is informational; a locked or broken database must
+        # never fail a build, so the first error turns recording off.
+        if self.disabled:
+            return None
+        try:
+            with self.db:
+                cur = None
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        cur = self.db.executemany(sql, params)
+                    else:
+                        cur = self.db.execute(sql, params)
+                return cur
+        except sqlite3.Error as e:
+            if self.warning is not None:
+                self.warning("Build history {} unavailable ({})".format(self.filename, e))
+            self.disabled = True
+            return None
+
+    def begin_run(self, configuration):
+        cur = self.write([ ("INSERT INTO runs (project, configuration, pid, started, status) VALUES (?, ?, ?, ?, ?)",
+                (self.project, configuration, os.getpid(), time(), "RUNNING")) ])
+        return cur.lastrowid if cur is not None else None
+
+    def record_step(self, run_id, step, status, started=None, wall=None, utime=None, stime=None, max_rss=None):
+        if run_id is None:
+            return
+        self.write([ ("INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, step, status, started, wall, utime, stime, max_rss)) ])
+
+    def end_run(self, run_id, status, wall, input_hash, metrics):
+        if run_id is None:
+            return
+        self.write([
+            ("UPDATE runs SET status = ?, wall = ?, input_hash = ? WHERE id = ?", (status, wall, input_hash, run_id)),
+            ("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?)", [ (run_id, name, value) for name, value in metrics.items() ]),
+        ])
+
+    def configurations(self):
+        return [ row["configuration"] for row in self.db.execute(
+                "SELECT DISTINCT configuration FROM runs WHERE project = ? ORDER BY configuration", (self.project,)) ]
+
+    def runs(self, configuration, limit=20):
+        rows = self.db.execute("SELECT * FROM runs WHERE project = ? AND configuration = ? AND status != 'RUNNING' "
+                "ORDER BY started DESC LIMIT ?", (self.project, configuration, limit)).fetchall()
+        return list(reversed(rows))
+
+    def steps(self, run_id):
+        return self.db.execute("SELECT * FROM steps WHERE run_id = ? ORDER BY started", (run_id,)).fetchall()
+
+    def metrics(self, run_id):
+        return { row["name"] : row["value"] for row in self.db.execute("SELECT * FROM metrics WHERE run_id = ?", (run_id,)) }
+
+    def step_samples(self, configuration, step, before=None, limit=HISTORY_WINDOW):
+        # Only runs where the tool actually ran say anything about its cost.
+        return self.db.execute("SELECT steps.* FROM steps JOIN runs ON runs.id = steps.run_id "
+                "WHERE runs.project = ? AND runs.configuration = ? AND steps.step = ? AND steps.status = 'OK' "
+                "AND runs.started < ? ORDER BY runs.started DESC LIMIT ?",
+                (self.project, configuration, step, before or time(), limit)).fetchall()
+
+    def estimate(self, configuration, step):
+        if self.disabled:
+            return None
+        try:
+            return median([ row["wall"] for row in self.step_samples(configuration, step) ])
+        except sqlite3.Error:
+            return None
+
+    def running(self):
+        result = []
+        for run in self.db.execute("SELECT * FROM runs WHERE project = ? AND status = 'RUNNING' ORDER BY started", (self.project,)):
+            if not is_alive(run["pid"]):
+                continue
+            for step in self.steps(run["id"]):
+                if step["status"] == "RUNNING":
+                    result.append((run, step))
+        return result
+
+def open_history(filename=None, warning=None):
+    try:
+        return BuildHistory(filename, warning)
+    except (OSError, sqlite3.Error) as e:
+        if warning is not None:
+            warning("Build history {} unavailable ({})".format(filename or get_history_path(), e))
+        return None
+
+def input_hash(keys):
+    return hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
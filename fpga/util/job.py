@@ -1,15 +1,44 @@
-import os, sys
+import os, sys, json
 if os.name == "posix":
     import resource, fcntl
-import subprocess, signal
-from select import select
-from time import time, localtime
+import subprocess, signal, selectors, threading
+from collections import deque
+from time import time, localtime, sleep
 import click
+from .sink import get_sink
+from .history import input_hash
+
+READ_CHUNK = 65536
+SAMPLE_INTERVAL = 0.5
+
+# ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere.
+MAXRSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+def exitcode(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def format_duration(secs):
+    if secs < 10:
+        return "{:.1f}s".format(secs)
+    secs = int(round(secs))
+    if secs < 60:
+        return "{}s".format(secs)
+    if secs < 3600:
+        return "{}m{:02d}s".format(secs // 60, secs % 60)
+    return "{}h{:02d}m".format(secs // 3600, (secs // 60) % 60)
+
+def format_rss(size):
+    if not size:
+        return "-"
+    return "{:.1f} MiB".format(size / (1024 * 1024))
 
 
 all_tasks_running = []
 
 def force_shutdown(signum, frame):
+    get_sink().flush()
     click.echo("FPGA ---- Keyboard interrupt or external termination signal ----")
     for task in list(all_tasks_running):
         task.terminate()
@@ -22,15 +51,19 @@ def hook_signals():
     signal.signal(signal.SIGTERM, force_shutdown)
 
 class FPGATask:
-    def __init__(self, job, info, deps, cmdline, logfile=None, logstderr=True, silent=False):
+    def __init__(self, job, info, deps, cmdline, logfile=None, logstderr=True, silent=False, configuration=None):
         self.running = False
         self.finished = False
         self.terminated = False
+        self.cancelled = False
         self.checkretcode = False
         self.job = job
         self.info = info
         self.deps = deps
-        if os.name == "posix":
+        self.configuration = configuration or job.configuration
+        self.start_time = None
+        self.end_time = None
+        if os.name == "posix" or cmdline is None:
             self.cmdline = cmdline
         else:
             # Windows command interpreter equivalents for sequential
@@ -48,15 +81,29 @@ class FPGATask:
         self.logfile = logfile
         self.noprintregex = None
         self.notify = []
-        self.linebuffer = ""
+        self.linebuffer = bytearray()
+        self.styled_info = click.style(self.info, fg="magenta")
+        self.tail = None
+        if self.job.quiet is not None:
+            self.tail = deque(maxlen=self.job.quiet)
+        self.chunks = deque()
+        self.pidfd = None
+        self.rusage = None
+        self.rss_samples = []
+        self.peak_rss = 0
         self.logstderr = logstderr
         self.silent = silent
 
         self.job.tasks_pending.append(self)
+        self.job.tasks_all.append(self)
 
         for dep in self.deps:
             dep.register_dep(self)
 
+        if self.job.config_status.get(self.configuration, "OK") != "OK":
+            self.job.tasks_pending.remove(self)
+            self.terminated = True
+
     def register_dep(self, next_task):
         if self.finished:
             next_task.poll()
@@ -66,12 +113,27 @@ class FPGATask:
     def log(self, line):
         if line is not None and (self.noprintregex is None or not self.noprintregex.match(line)):
             if self.logfile is not None:
-                click.echo(line, file=self.logfile)
+                self.job.sink.write(line, self.logfile)
             if line.startswith("Warning:"):
                 line = click.style(line, fg="yellow", bold=True)
             elif "ERROR:" in line:
                 line = click.style(line, fg="red", bold=True)
-            self.job.log(click.style(self.info, fg="magenta") + ": " + line)
+            text = self.job.dress_message(self.styled_info + ": " + line, self.configuration)
+            if self.tail is not None:
+                # Quiet mode: the full output still goes to the logfile,
+                # the terminal only sees it if the task fails.
+                self.tail.append(text)
+                self.job.echo(text, self.configuration, terminal=False)
+            else:
+                self.job.echo(text, self.configuration)
+
+    def dump_tail(self):
+        if not self.tail:
+            return
+        self.job.sink.write(self.job.dress_message("{}: last {} lines of output:".format(self.styled_info, len(self.tail)), self.configuration))
+        for text in self.tail:
+            self.job.sink.write(text)
+        self.tail.clear()
 
     def handle_output(self, line):
         if self.terminated: # or len(line) == 0:
@@ -84,12 +146,25 @@ class FPGATask:
         if self.logfile is not None:
             self.logfile.close()
         if (retcode != 0):
-            self.job.error("")
+            self.terminated = True
+            self.dump_tail()
+            self.job.error("", self.configuration)
+
+    def prepare(self):
+        # Called once all dependencies have finished; returning False
+        # completes the task without starting its process. Tasks with
+        # no cmdline do all their work here.
+        return self.cmdline is not None
+
+    def complete(self):
+        self.finished = True
+        for next_task in self.notify:
+            next_task.poll()
 
     def terminate(self, timeout=False):
         if self.running:
             if not self.silent:
-                self.job.log("{}: terminating process".format(click.style(self.info, fg="magenta")))
+                self.job.log("{}: terminating process".format(click.style(self.info, fg="magenta")), self.configuration)
             if os.name == "posix":
                 try:
                     os.killpg(self.p.pid, signal.SIGTERM)
@@ -98,6 +173,10 @@ class FPGATask:
             self.p.terminate()
             self.job.tasks_running.remove(self)
             all_tasks_running.remove(self)
+            self.running = False
+            self.release()
+        elif self in self.job.tasks_pending:
+            self.job.tasks_pending.remove(self)
         self.terminated = True
 
     def poll(self):
@@ -109,8 +188,17 @@ class FPGATask:
                 if not dep.finished:
                     return
 
+            if self.job.max_tasks is not None and len(self.job.tasks_running) >= self.job.max_tasks:
+                return
+
+            if not self.prepare():
+                if not self.terminated:
+                    self.job.tasks_pending.remove(self)
+                    self.complete()
+                return
+
             if not self.silent:
-                self.job.log("{}: starting process \"{}\"".format(click.style(self.info, fg="magenta"), self.cmdline))
+                self.job.log("{}: starting process \"{}\"".format(click.style(self.info, fg="magenta"), self.cmdline), self.configuration)
 
             if os.name == "posix":
                 def preexec_fn():
@@ -131,64 +219,181 @@ class FPGATask:
             self.job.tasks_running.append(self)
             all_tasks_running.append(self)
             self.running = True
+            self.start_time = time()
+            self.job.watch(self)
+            self.job.task_started(self)
             return
 
+        self.read_output(drain=True)
+        self.check_exit()
+
+    def read_chunk(self):
+        # Returns None when no data is available right now, b"" at EOF.
+        if os.name != "posix":
+            return self.chunks.popleft() if self.chunks else None
+        try:
+            return os.read(self.p.stdout.fileno(), READ_CHUNK)
+        except (BlockingIOError, InterruptedError):
+            return None
+
+    def reader_thread(self):
+        # Windows pipes cannot be polled, so a thread feeds read_chunk().
         while True:
-            outs = self.p.stdout.readline().decode("utf-8")
-            if len(outs) == 0: break
-            if outs[-1] != '\n':
-                self.linebuffer += outs
+            data = self.p.stdout.read1(READ_CHUNK)
+            self.chunks.append(data)
+            if not data:
                 break
-            outs = (self.linebuffer + outs).rstrip()
-            self.linebuffer = ""
-            self.handle_output(outs)
-
-        if self.p.poll() is not None:
-            if not self.silent:
-                self.job.log("{}: finished (returncode={})".format(click.style(self.info, fg="magenta"), self.p.returncode))
-            self.job.tasks_running.remove(self)
-            all_tasks_running.remove(self)
-            self.running = False
 
-            if self.p.returncode == 127:
-                self.job.status = "ERROR"
-                if not self.silent:
-                    self.job.error("{}: COMMAND NOT FOUND. ERROR.".format(click.style(self.info, fg="magenta")))
-                self.terminated = True
-                self.job.terminate()
+    def read_output(self, drain=False):
+        while self.running and not self.p.stdout.closed:
+            data = self.read_chunk()
+            if data is None:
+                return
+            if not data:
+                self.job.unwatch(self.p.stdout)
+                self.p.stdout.close()
+                return
+            self.linebuffer += data
+            end = self.linebuffer.rfind(b"\n")
+            if end >= 0:
+                lines = self.linebuffer[:end].decode("utf-8", errors="replace").split("\n")
+                del self.linebuffer[:end + 1]
+                for line in lines:
+                    self.handle_output(line.rstrip())
+            if not drain and len(data) < READ_CHUNK:
                 return
 
-            self.handle_exit(self.p.returncode)
+    def flush_output(self):
+        if self.linebuffer:
+            line = self.linebuffer.decode("utf-8", errors="replace").rstrip()
+            self.linebuffer = bytearray()
+            self.handle_output(line)
+
+    def release(self):
+        if not self.p.stdout.closed:
+            self.job.unwatch(self.p.stdout)
+            self.p.stdout.close()
+        if self.pidfd is not None:
+            self.job.unwatch(self.pidfd)
+            os.close(self.pidfd)
+            self.pidfd = None
+
+    def on_exit(self):
+        self.read_output(drain=True)
+        self.check_exit()
+
+    def reap(self):
+        # wait4() hands back the resource usage of the child and all the
+        # descendants it waited for, which Popen.poll() would throw away.
+        if os.name != "posix" or self.p.returncode is not None:
+            return self.p.poll() is not None
+        try:
+            pid, status, rusage = os.wait4(self.p.pid, os.WNOHANG)
+        except ChildProcessError:
+            return self.p.poll() is not None
+        if pid == 0:
+            return False
+        self.rusage = rusage
+        self.peak_rss = max(self.peak_rss, rusage.ru_maxrss * MAXRSS_SCALE)
+        self.p.returncode = exitcode(status)
+        return True
+
+    def sample_rss(self, now):
+        rss = 0
+        pids = [self.p.pid]
+        while pids:
+            pid = pids.pop()
+            try:
+                with open("/proc/{}/status".format(pid)) as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss += int(line.split()[1]) * 1024
+                            break
+                with open("/proc/{}/task/{}/children".format(pid, pid)) as f:
+                    pids.extend(int(x) for x in f.read().split())
+            except (OSError, ValueError):
+                pass
+        if rss:
+            self.rss_samples.append((now, rss))
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def check_exit(self):
+        if not self.running or not self.reap():
+            return
 
-            if self.checkretcode and self.p.returncode != 0:
-                self.job.status = "ERROR"
-                if not self.silent:
-                    self.job.error("{}: job failed. ERROR.".format(click.style(self.info, fg="magenta")))
-                self.terminated = True
-                self.job.terminate()
-                return
+        self.read_output(drain=True)
+        if not self.running:
+            return
+        self.flush_output()
+        if not self.silent:
+            self.job.log("{}: finished (returncode={})".format(click.style(self.info, fg="magenta"), self.p.returncode), self.configuration)
+        self.job.tasks_running.remove(self)
+        all_tasks_running.remove(self)
+        self.running = False
+        self.end_time = time()
+        self.release()
+        if self.job.history is not None:
+            self.job.record_task(self)
+
+        if self.p.returncode == 127:
+            self.terminated = True
+            self.dump_tail()
+            self.job.error("{}: COMMAND NOT FOUND. ERROR.".format(click.style(self.info, fg="magenta")) if not self.silent else "", self.configuration)
+            return
+
+        self.handle_exit(self.p.returncode)
+        if self.terminated:
+            return
 
-            self.finished = True
-            for next_task in self.notify:
-                next_task.poll()
+        if self.checkretcode and self.p.returncode != 0:
+            self.terminated = True
+            self.dump_tail()
+            self.job.error("{}: job failed. ERROR.".format(click.style(self.info, fg="magenta")) if not self.silent else "", self.configuration)
             return
 
+        self.complete()
+        # A slot was freed, let tasks held back by max_tasks start.
+        self.job.poll_pending()
+
 
 class FPGAAbort(BaseException):
     pass
 
 
 class FPGAJob:
-    def __init__(self, args, cfg, early_logs, configuration, timeout=None):
+    def __init__(self, args, cfg, early_logs, configuration, timeout=None, max_tasks=None, quiet=None, history=None):
         self.args = args
         self.cfg = cfg
+        self.early_logs = early_logs
         self.configuration = configuration
         self.status = "OK"
         self.total_time = 0
         self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.quiet = quiet
+        self.history = history
+        self.sink = get_sink()
+        self.clock_second = None
+        self.clock_text = None
 
         self.tasks_running = []
         self.tasks_pending = []
+        self.tasks_all = []
+
+        self.selector = None
+        self.wakeup_fd = None
+        if os.name == "posix":
+            self.selector = selectors.DefaultSelector()
+        self.timers = []
+        if os.path.isdir("/proc/self"):
+            self.add_timer(SAMPLE_INTERVAL, self.sample_tasks)
+
+        self.configurations = []
+        self.config_status = dict()
+        self.config_summary = dict()
+        self.config_metrics = dict()
+        self.run_ids = dict()
+        self.logfiles = dict()
 
         self.start_clock_time = time()
 
@@ -198,80 +403,289 @@ class FPGAJob:
 
         self.summary = list()
 
-        self.logfile = open("{}/logfile.txt".format(os.path.join(".fpga", self.configuration)), "a")
+        if configuration is not None:
+            self.add_configuration(configuration)
 
-        for line in early_logs:
-            click.echo(line, file=self.logfile)
+    def add_configuration(self, configuration):
+        if configuration in self.config_status:
+            return
+        work_dir = os.path.join(".fpga", configuration)
+        os.makedirs(work_dir, exist_ok=True)
+        self.configurations.append(configuration)
+        self.config_status[configuration] = "OK"
+        self.config_summary[configuration] = []
+        self.config_metrics[configuration] = dict()
+        self.logfiles[configuration] = open(os.path.join(work_dir, "logfile.txt"), "a")
+        if self.history is not None:
+            self.run_ids[configuration] = self.history.begin_run(configuration)
+
+        for line in self.early_logs:
+            self.sink.write(line, self.logfiles[configuration])
+
+    def watch(self, task):
+        if self.selector is None:
+            threading.Thread(target=task.reader_thread, daemon=True).start()
+            return
+        self.selector.register(task.p.stdout, selectors.EVENT_READ, task.read_output)
+        # Child exit is signalled through a pidfd where the kernel has
+        # them, otherwise through SIGCHLD waking up the selector.
+        try:
+            task.pidfd = os.pidfd_open(task.p.pid)
+        except (AttributeError, OSError):
+            self.watch_sigchld()
+            return
+        self.selector.register(task.pidfd, selectors.EVENT_READ, task.on_exit)
 
-    def taskloop(self):
-        for task in self.tasks_pending:
+    def watch_sigchld(self):
+        if self.wakeup_fd is not None:
+            return
+        rfd, wfd = os.pipe()
+        os.set_blocking(rfd, False)
+        os.set_blocking(wfd, False)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.set_wakeup_fd(wfd, warn_on_full_buffer=False)
+        self.wakeup_fd = rfd
+        self.wakeup_wfd = wfd
+        self.selector.register(rfd, selectors.EVENT_READ, self.on_sigchld)
+
+    def on_sigchld(self):
+        try:
+            while os.read(self.wakeup_fd, 4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        for task in list(self.tasks_running):
+            if task.pidfd is None:
+                task.check_exit()
+
+    def unwatch(self, fileobj):
+        if self.selector is not None:
+            try:
+                self.selector.unregister(fileobj)
+            except (KeyError, ValueError):
+                pass
+
+    def task_started(self, task):
+        if self.history is None:
+            return
+        self.record_task(task)
+        eta = self.history.estimate(task.configuration, task.info)
+        if eta is not None and not task.silent:
+            self.log("{}: expected to take about {} (ETA {})".format(task.styled_info, format_duration(eta),
+                    "{:02d}:{:02d}:{:02d}".format(*localtime(task.start_time + eta)[3:6])), task.configuration)
+
+    def record_task(self, task):
+        run_id = self.run_ids.get(task.configuration)
+        if task.cancelled:
+            self.history.record_step(run_id, task.info, "CANCELLED", task.start_time)
+            return
+        if task.start_time is None:
+            self.history.record_step(run_id, task.info, "SKIPPED" if task.finished else "NOT RUN")
+            return
+        if task.end_time is None:
+            status = "RUNNING" if task.running else "KILLED"
+        elif task.p.returncode != 0:
+            status = "FAILED"
+        else:
+            status = "OK"
+        utime, stime, wall = None, None, None
+        if task.end_time is not None:
+            wall = task.end_time - task.start_time
+        if task.rusage is not None:
+            utime, stime = task.rusage.ru_utime, task.rusage.ru_stime
+        self.history.record_step(run_id, task.info, status, task.start_time, wall, utime, stime, task.peak_rss or None)
+
+    def record_history(self, configuration):
+        run_id = self.run_ids.get(configuration)
+        if run_id is None:
+            return
+        keys = []
+        for task in self.configuration_tasks(configuration):
+            if getattr(task, "key", None):
+                keys.append(task.key)
+            self.record_task(task)
+        self.history.end_run(run_id, self.config_status[configuration], time() - self.start_clock_time,
+                input_hash(keys) if keys else None, self.config_metrics[configuration])
+
+    def add_timer(self, interval, callback):
+        self.timers.append([ time() + interval, interval, callback ])
+
+    def add_watch(self, fileobj, callback):
+        if self.selector is None:
+            return False
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+        return True
+
+    def sample_tasks(self):
+        now = time()
+        for task in self.tasks_running:
+            task.sample_rss(now)
+
+    def cancel(self, tasks):
+        # Stale work is stopped through the normal terminate path, along
+        # with everything depending on it, without failing the configuration.
+        seen = set()
+        todo = list(tasks)
+        while todo:
+            task = todo.pop()
+            if task in seen:
+                continue
+            seen.add(task)
+            todo.extend(task.notify)
+            if not task.finished and not task.terminated:
+                task.cancelled = True
+                task.terminate()
+
+    def poll_pending(self):
+        for task in list(self.tasks_pending):
             task.poll()
 
-        while len(self.tasks_running):
-            fds = []
-            for task in self.tasks_running:
-                if task.running:
-                    fds.append(task.p.stdout)
+    def taskloop(self):
+        self.poll_pending()
 
-            if os.name == "posix":
-                try:
-                    select(fds, [], [], 1.0) == ([], [], [])
-                except InterruptedError:
-                    pass
+        while len(self.tasks_running):
+            timeout = None
+            if self.timeout is not None:
+                timeout = max(0, self.start_clock_time + self.timeout - time())
+            if self.timers:
+                wait = max(0, min(timer[0] for timer in self.timers) - time())
+                timeout = wait if timeout is None else min(timeout, wait)
+
+            if self.selector is not None:
+                for key, mask in self.selector.select(timeout):
+                    key.data()
             else:
-                sleep(0.1)
-
-            for task in self.tasks_running:
-                task.poll()
+                sleep(0.05)
+                for task in list(self.tasks_running):
+                    task.poll()
 
-            for task in self.tasks_pending:
-                task.poll()
+            for timer in self.timers:
+                if time() >= timer[0]:
+                    timer[2]()
+                    timer[0] = time() + timer[1]
 
             if self.timeout is not None:
-                total_clock_time = int(time() - self.start_clock_time)
-                if total_clock_time > self.timeout:
+                if time() - self.start_clock_time >= self.timeout:
                     self.log("Reached TIMEOUT ({} seconds). Terminating all tasks.".format(self.timeout))
                     self.status = "TIMEOUT"
+                    for configuration in self.configurations:
+                        if self.config_status[configuration] == "OK":
+                            self.config_status[configuration] = "TIMEOUT"
                     self.terminate(timeout=True)
 
-    def dress_message(self, logmessage):
-        tm = localtime()
+        # Whatever is still pending waits on a task that failed.
+        for task in list(self.tasks_pending):
+            if self.config_status[task.configuration] == "OK":
+                self.error("{}: dependency failed. ERROR.".format(click.style(task.info, fg="magenta")), task.configuration)
+            task.terminate()
+
+    def dress_message(self, logmessage, configuration=None):
+        now = int(time())
+        if now != self.clock_second:
+            tm = localtime(now)
+            self.clock_second = now
+            self.clock_text = click.style("FPGA", fg="blue") + " " + \
+                    click.style("{:2d}:{:02d}:{:02d}".format(tm.tm_hour, tm.tm_min, tm.tm_sec), fg="green")
         return " ".join([
-            click.style("FPGA", fg="blue"),
-            click.style("{:2d}:{:02d}:{:02d}".format(tm.tm_hour, tm.tm_min, tm.tm_sec), fg="green"),
-            "[" + click.style(self.configuration, fg="blue") + "]",
+            self.clock_text,
+            "[" + click.style(configuration or self.configuration or "all", fg="blue") + "]",
             logmessage
         ])
 
-    def log(self, logmessage):
-        text = self.dress_message(logmessage)
-        click.echo(text)
-        click.echo(text, file=self.logfile)
+    def echo(self, text, configuration=None, terminal=True):
+        if terminal:
+            self.sink.write(text)
+        logfile = self.logfiles.get(configuration or self.configuration)
+        if logfile is not None:
+            self.sink.write(text, logfile)
 
-    def warning(self, logmessage):
-        text = self.dress_message(click.style("Warning: " + logmessage, fg="yellow", bold=True))
-        click.echo(text)
-        click.echo(text, file=self.logfile)
+    def log(self, logmessage, configuration=None):
+        self.echo(self.dress_message(logmessage, configuration), configuration)
 
-    def error(self, logmessage):
+    def warning(self, logmessage, configuration=None):
+        self.echo(self.dress_message(click.style("Warning: " + logmessage, fg="yellow", bold=True), configuration), configuration)
+
+    def error(self, logmessage, configuration=None):
         if (logmessage):
-            text = self.dress_message(click.style("ERROR: " + logmessage, fg="red", bold=True))
-            click.echo(text)
-            click.echo(text, file=self.logfile)
+            self.echo(self.dress_message(click.style("ERROR: " + logmessage, fg="red", bold=True), configuration), configuration)
         self.status = "ERROR"
         self.retcode = 16
+        if configuration is not None:
+            # Only this configuration stops; the rest of the job carries on.
+            self.config_status[configuration] = "ERROR"
+            self.terminate(configuration=configuration)
+            with open("{}/{}".format(os.path.join(".fpga", configuration), "ERROR"), "w") as f:
+                click.echo(logmessage, file=f)
+            return
+        for configuration in self.configurations:
+            self.config_status[configuration] = "ERROR"
         self.terminate()
-        with open("{}/{}".format(os.path.join(".fpga", self.configuration), self.status), "w") as f:
-            click.echo(logmessage, file=f)
+        if self.configuration is not None:
+            with open("{}/{}".format(os.path.join(".fpga", self.configuration), self.status), "w") as f:
+                click.echo(logmessage, file=f)
+        self.sink.flush()
         raise FPGAAbort(logmessage)
 
-    def terminate(self, timeout=False):
-        for task in list(self.tasks_running):
-            task.terminate(timeout=timeout)
+    def terminate(self, timeout=False, configuration=None):
+        for task in list(self.tasks_running) + list(self.tasks_pending):
+            if configuration is None or task.configuration == configuration:
+                task.terminate(timeout=timeout)
 
     def run(self):
         self.taskloop()
 
+    def format_time(self, secs):
+        return "{}:{:02d}:{:02d} ({})".format(secs // (60*60), (secs // 60) % 60, secs % 60, secs)
+
+    def configuration_tasks(self, configuration):
+        return [ task for task in self.tasks_all if task.configuration == configuration and task.cmdline is not None ]
+
+    def configuration_summary(self, configuration):
+        tasks = self.configuration_tasks(configuration)
+        if not tasks:
+            return []
+        width = max(len(task.info) for task in tasks)
+        lines = [ "{:<{}}  {:>9}  {:>8}  {:>8}  {:>12}".format("step", width, "wall", "user", "sys", "peak RSS") ]
+        for task in tasks:
+            if task.cancelled:
+                wall = "cancelled"
+            elif task.start_time is None:
+                wall = "skipped" if task.finished else "not run"
+            elif task.end_time is None:
+                wall = "killed"
+            else:
+                wall = "{:.1f}s".format(task.end_time - task.start_time)
+            utime, stime = "-", "-"
+            if task.rusage is not None:
+                utime = "{:.1f}s".format(task.rusage.ru_utime)
+                stime = "{:.1f}s".format(task.rusage.ru_stime)
+            lines.append("{:<{}}  {:>9}  {:>8}  {:>8}  {:>12}".format(task.info, width, wall, utime, stime, format_rss(task.peak_rss)))
+        return lines
+
+    def write_trace(self, configuration):
+        # Chrome trace event format, loadable in chrome://tracing or Perfetto.
+        def ts(t):
+            return int((t - self.start_clock_time) * 1000000)
+        events = [ { "name" : "process_name", "ph" : "M", "pid" : 1, "args" : { "name" : configuration } } ]
+        for tid, task in enumerate(self.configuration_tasks(configuration), 1):
+            if task.start_time is None:
+                continue
+            end_time = task.end_time or time()
+            args = { "cmdline" : task.cmdline, "peak_rss" : task.peak_rss }
+            if task.rusage is not None:
+                args["user"] = task.rusage.ru_utime
+                args["sys"] = task.rusage.ru_stime
+                args["returncode"] = task.p.returncode
+            events.append({ "name" : "thread_name", "ph" : "M", "pid" : 1, "tid" : tid, "args" : { "name" : task.info } })
+            events.append({ "name" : task.info, "cat" : "task", "ph" : "X", "pid" : 1, "tid" : tid,
+                    "ts" : ts(task.start_time), "dur" : ts(end_time) - ts(task.start_time), "args" : args })
+            for t, rss in task.rss_samples + [ (end_time, 0) ]:
+                events.append({ "name" : "rss " + task.info, "ph" : "C", "pid" : 1, "ts" : ts(t), "args" : { "MiB" : round(rss / (1024 * 1024), 1) } })
+        filename = os.path.join(".fpga", configuration, "trace.json")
+        with open(filename + ".tmp", "w") as f:
+            json.dump({ "traceEvents" : events, "displayTimeUnit" : "ms" }, f)
+        os.replace(filename + ".tmp", filename)
+
     def final(self):
         total_clock_time = int(time() - self.start_clock_time)
 
@@ -281,15 +695,12 @@ class FPGAJob:
             self.total_time = total_process_time
 
             self.summary = [
-                "Elapsed clock time [H:MM:SS (secs)]: {}:{:02d}:{:02d} ({})".format
-                        (total_clock_time // (60*60), (total_clock_time // 60) % 60, total_clock_time % 60, total_clock_time),
-                "Elapsed process time [H:MM:SS (secs)]: {}:{:02d}:{:02d} ({})".format
-                        (total_process_time // (60*60), (total_process_time // 60) % 60, total_process_time % 60, total_process_time),
+                "Elapsed clock time [H:MM:SS (secs)]: {}".format(self.format_time(total_clock_time)),
+                "Elapsed process time [H:MM:SS (secs)]: {}".format(self.format_time(total_process_time)),
             ] + self.summary
         else:
             self.summary = [
-                "Elapsed clock time [H:MM:SS (secs)]: {}:{:02d}:{:02d} ({})".format
-                        (total_clock_time // (60*60), (total_clock_time // 60) % 60, total_clock_time % 60, total_clock_time),
+                "Elapsed clock time [H:MM:SS (secs)]: {}".format(self.format_time(total_clock_time)),
                 "Elapsed process time unvailable on Windows"
             ] + self.summary
 
@@ -297,7 +708,38 @@ class FPGAJob:
             self.log(click.style("summary", fg="magenta") + ": " + line)
 
         self.retcode = 0
-        if self.status == "TIMEOUT": self.retcode = 8
-        if self.status == "ERROR": self.retcode = 16
+        for configuration in self.configurations:
+            status = self.config_status[configuration]
+            retcode = 0
+            if status == "TIMEOUT": retcode = 8
+            if status == "ERROR": retcode = 16
+            self.retcode = max(self.retcode, retcode)
+            for line in self.configuration_summary(configuration):
+                self.log(click.style("summary", fg="magenta") + ": " + line, configuration)
+            self.write_trace(configuration)
+            if self.history is not None:
+                self.record_history(configuration)
+            for line in self.config_summary[configuration]:
+                self.log(click.style("summary", fg="magenta") + ": " + line, configuration)
+            if configuration != self.configuration:
+                self.log("DONE ({}, rc={})".format(status, retcode), configuration)
+
+        if self.status == "TIMEOUT": self.retcode = max(self.retcode, 8)
+        if self.status == "ERROR": self.retcode = max(self.retcode, 16)
+        if self.retcode == 8: self.status = "TIMEOUT"
+        if self.retcode == 16: self.status = "ERROR"
 
         self.log("DONE ({}, rc={})".format(self.status, self.retcode))
+        self.sink.flush()
+
+    def close(self):
+        self.sink.flush()
+        for logfile in self.logfiles.values():
+            logfile.close()
+        if self.selector is not None:
+            self.selector.close()
+        if self.wakeup_fd is not None:
+            signal.set_wakeup_fd(-1)
+            os.close(self.wakeup_fd)
+            os.close(self.wakeup_wfd)
+            self.wakeup_fd = None
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import subprocess
+from fpga.util.tools import which
+
+MANIFEST_VERSION = 1
+
+# Flag each tool prints its version with; tools missing here are
+# identified by path and binary stat only.
+tool_version_args = {
+    "yosys" : "-V",
+    "nextpnr-ice40" : "--version",
+    "nextpnr-ecp5" : "--version",
+    "ecppack" : "--version",
+}
+
+def hash_file(path, blocksize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def hash_data(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+class BuildManifest:
+    def __init__(self, work_dir):
+        self.filename = os.path.join(work_dir, "manifest.json")
+        self.data = { "version" : MANIFEST_VERSION, "steps" : {}, "tools" : {} }
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.data = data
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        tmpname = self.filename + ".tmp"
+        with open(tmpname, "w") as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+        os.replace(tmpname, self.filename)
+
+    def tool_identity(self, name):
+        path = which(name)
+        if path is None:
+            return None
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        known = self.data["tools"].get(path)
+        if known is not None and known["stamp"] == stamp:
+            return { "path" : path, "stamp" : stamp, "version" : known["version"] }
+        version = ""
+        if name in tool_version_args:
+            try:
+                res = subprocess.run([path, tool_version_args[name]], stdin=subprocess.DEVNULL,
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=30)
+                version = res.stdout.decode("utf-8", errors="replace").strip()
+            except (OSError, subprocess.SubprocessError):
+                pass
+        self.data["tools"][path] = { "stamp" : stamp, "version" : version }
+        return { "path" : path, "stamp" : stamp, "version" : version }
+
+    def step_key(self, step, inputs, cmdline, tools):
+        return hash_data({
+            "step" : step,
+            "cmdline" : cmdline,
+            "inputs" : { x : hash_file(x) for x in inputs },
+            "tools" : { x : self.tool_identity(x) for x in tools },
+        })
+
+    def is_up_to_date(self, step, key, outputs):
+        known = self.data["steps"].get(step)
+        if known is None or known["key"] != key:
+            return False
+        for x in outputs:
+            if not os.path.exists(x) or os.path.getsize(x) != known["outputs"].get(x, {}).get("size"):
+                return False
+        return True
+
+    def record(self, step, key, outputs):
+        self.data["steps"][step] = {
+            "key" : key,
+            "outputs" : { x : { "sha256" : hash_file(x), "size" : os.path.getsize(x) } for x in outputs },
+        }
+        self.save()
+        return { x : item["sha256"] for x, item in self.data["steps"][step]["outputs"].items() }
+
+    def forget(self, step):
+        if self.data["steps"].pop(step, None) is not None:
+            self.save()
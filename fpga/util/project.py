@@ -1,35 +1,41 @@
 import glob
 import configparser
-import json
 import os
-from fpga.util import get_directory
+import sys
+import click
 from fpga.arch import getArchitectureByName
+from fpga.util.database import getBoardDatabase
 
 class Project():
-    def __init__(self, filename, ctx):
+    def __init__(self, filename, ctx, board=None):
         self.ctx = ctx
         self.filename = filename
         config = configparser.ConfigParser()
         config.read(filename)
 
-        with open(os.path.join(get_directory('data'), 'apio', 'boards.json')) as json_file:
-            boards = json.load(json_file)
-        with open(os.path.join(get_directory('data'), 'apio', 'fpgas.json')) as json_file:
-            fpgas = json.load(json_file)
-        self.board = config.get("env", "board")
-        f = fpgas[boards[self.board]["fpga"]]
-        self.arch = f["arch"]
-        if self.arch=="ice40":
-            self.device = f["type"]+f["size"]
+        self.boards = config.get("env", "boards", fallback="").replace(",", " ").split()
+        if board is not None:
+            self.board = board
+        elif config.has_option("env", "board"):
+            self.board = config.get("env", "board")
         else:
-            self.device = f["type"]
-        self.package = f["pack"]
+            self.board = self.boards[0]
+        if self.board not in self.boards:
+            self.boards.insert(0, self.board)
+        board_data = getBoardDatabase().getBoard(self.board)
+        if board_data is None or "arch" not in board_data:
+            click.secho('[{}] Unknown board {}'.format('validate', self.board), fg="red")
+            sys.exit(-1)
+        self.arch = board_data["arch"]
+        self.device = board_data["device"]
+        self.package = board_data["package"]
+        self.frequency = config.get("env", "frequency", fallback=None)
 
     def getProjectFilename(self):
         return self.filename
 
-    def getArchitecture(self):
-        return getArchitectureByName(self.ctx, self.arch, self)
+    def getArchitecture(self, job=None):
+        return getArchitectureByName(self.ctx, self.arch, self, job)
 
     def getDevice(self):
         return self.device
@@ -38,7 +44,7 @@ class Project():
         return None
 
     def getFrequency(self):
-        return None
+        return self.frequency
 
     def getPackage(self):
         return self.package
@@ -52,6 +58,9 @@ class Project():
     def getBoard(self):
         return None
 
+    def getBoards(self):
+        return self.boards
+
     def getSourceFiles(self):
         files = list(set(glob.glob("*.v")) - set(glob.glob("*_tb.v")))
         return [f for f in sorted(files)]
@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+import socket
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, wait
+
+DEFAULT_TIMEOUT = 5.0
+
+class RemoteCacheError(Exception):
+    pass
+
+class RemoteCache:
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, workers=4, warning=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.warning = warning
+        self.disabled = False
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.uploads = []
+        self.failed_uploads = []
+
+    def disable(self, reason):
+        # A slow or broken server must never cost more than one timeout,
+        # so the first failure turns remote lookups off for this run.
+        if not self.disabled and self.warning is not None:
+            self.warning("Remote cache {} unavailable ({}), building locally".format(self.url, reason))
+        self.disabled = True
+
+    def open(self, method, path, data=None, headers={}):
+        req = urllib.request.Request(self.url + path, data=data, method=method, headers=headers)
+        return urllib.request.urlopen(req, timeout=self.timeout)
+
+    def get_entry(self, key):
+        if self.disabled:
+            return None
+        try:
+            with self.open("GET", "/ac/" + key) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                self.disable("HTTP {}".format(e.code))
+        except (urllib.error.URLError, socket.timeout, OSError, ValueError) as e:
+            self.disable(e)
+        return None
+
+    def fetch(self, digest, filename):
+        if self.disabled:
+            return False
+        tmpname = "{}.{}.tmp".format(filename, os.getpid())
+        try:
+            h = hashlib.sha256()
+            with self.open("GET", "/cas/" + digest) as resp, open(tmpname, "wb") as f:
+                while True:
+                    block = resp.read(1 << 20)
+                    if not block:
+                        break
+                    h.update(block)
+                    f.write(block)
+            if h.hexdigest() != digest:
+                raise RemoteCacheError("integrity check failed for {}".format(digest))
+            os.chmod(tmpname, 0o444)
+            os.replace(tmpname, filename)
+            return True
+        except (urllib.error.URLError, socket.timeout, OSError, RemoteCacheError) as e:
+            self.disable(e)
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        return False
+
+    def put(self, path, filename=None, data=None):
+        headers = { "Content-Type" : "application/octet-stream" }
+        if filename is not None:
+            headers["Content-Length"] = str(os.path.getsize(filename))
+            with open(filename, "rb") as f:
+                with self.open("PUT", path, data=f, headers=headers):
+                    pass
+        else:
+            with self.open("PUT", path, data=data, headers=headers):
+                pass
+
+    def upload_entry(self, key, entry, objects):
+        for digest, filename in objects.items():
+            try:
+                with self.open("HEAD", "/cas/" + digest):
+                    continue
+            except urllib.error.HTTPError as e:
+                if e.code != 404:
+                    raise
+            self.put("/cas/" + digest, filename=filename)
+        # The entry goes last, so readers never see it before its objects.
+        self.put("/ac/" + key, data=json.dumps(entry).encode("utf-8"))
+
+    def upload(self, key, entry, objects):
+        if self.disabled:
+            return
+        def task():
+            try:
+                self.upload_entry(key, entry, objects)
+            except (urllib.error.URLError, socket.timeout, OSError):
+                self.failed_uploads.append(key)
+        self.uploads.append(self.executor.submit(task))
+
+    def flush(self, timeout=None):
+        done, pending = wait(self.uploads, timeout=timeout)
+        for x in pending:
+            x.cancel()
+        self.uploads = []
+        failed = len(self.failed_uploads) + len(pending)
+        self.failed_uploads = []
+        return failed
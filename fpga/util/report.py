@@ -0,0 +1,27 @@
+import json
+
+def read_nextpnr_report(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+def summarize_nextpnr_report(report):
+    lines = []
+    for clock, data in sorted(report.get("fmax", {}).items()):
+        line = "Fmax {}: {:.2f} MHz".format(clock, data["achieved"])
+        if data.get("constraint"):
+            line += " ({} at {:.2f} MHz)".format("PASS" if data["achieved"] >= data["constraint"] else "FAIL", data["constraint"])
+        lines.append(line)
+    for bel, data in sorted(report.get("utilization", {}).items()):
+        if data["used"]:
+            lines.append("Utilisation {}: {}/{} ({}%)".format(bel, data["used"], data["available"],
+                    100 * data["used"] // max(data["available"], 1)))
+    return lines
+
+def nextpnr_metrics(report):
+    metrics = dict()
+    for clock, data in report.get("fmax", {}).items():
+        metrics["fmax." + clock] = data["achieved"]
+    for bel, data in report.get("utilization", {}).items():
+        if data["used"]:
+            metrics["util." + bel] = data["used"]
+    return metrics
@@ -0,0 +1,71 @@
+import re
+import sys
+import atexit
+import threading
+
+ansi_regex = re.compile(r"\033\[[;?0-9]*[a-zA-Z]")
+
+def strip_ansi(text):
+    return ansi_regex.sub("", text)
+
+class LogSink:
+    def __init__(self, stream=None, interval=0.1):
+        self.stream = stream or sys.stdout
+        self.color = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = dict()
+        self.order = []
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self.flusher, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, text, target=None):
+        # Lines are only queued here; the flusher thread (or an explicit
+        # flush) hands them to the terminal and logfiles in one write each.
+        if target is None:
+            target = self.stream
+            if not self.color:
+                text = strip_ansi(text)
+        else:
+            text = strip_ansi(text)
+        with self.lock:
+            if target not in self.pending:
+                self.pending[target] = []
+                self.order.append(target)
+            self.pending[target].append(text)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, order = self.pending, self.order
+                self.pending, self.order = dict(), []
+            for target in order:
+                try:
+                    target.write("\n".join(pending[target]) + "\n")
+                    target.flush()
+                except (OSError, ValueError):
+                    pass
+
+    def flusher(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.flush()
+
+_sink = None
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        _sink = LogSink()
+    return _sink
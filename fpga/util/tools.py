@@ -0,0 +1,18 @@
+import os
+import shutil
+
+_which = dict()
+
+def which(name):
+    # Found tools are remembered per PATH; a missing tool is looked up
+    # again every time so installing it takes effect immediately.
+    key = (name, os.environ.get("PATH"))
+    path = _which.get(key)
+    if path is not None and os.access(path, os.X_OK):
+        return path
+    path = shutil.which(name)
+    if path is None:
+        _which.pop(key, None)
+    else:
+        _which[key] = path
+    return path
@@ -0,0 +1,166 @@
+import os
+import struct
+import select
+import fnmatch
+import ctypes
+import ctypes.util
+from time import time, sleep
+
+POLL_INTERVAL = 0.5
+DEBOUNCE = 0.3
+
+WATCH_PATTERNS = [ "*.v", "*.sv", "*.vh", "*.svh", "*.pcf", "*.lpf", "apio.ini" ]
+
+# From linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+event_header = struct.Struct("iIII")
+
+_libc = None
+
+def get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        _libc.inotify_init1.argtypes = [ ctypes.c_int ]
+        _libc.inotify_add_watch.argtypes = [ ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32 ]
+    return _libc
+
+def inotify_init():
+    try:
+        fd = get_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (AttributeError, TypeError):
+        raise OSError("inotify not available")
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    return fd
+
+def inotify_add_watch(fd, path, mask):
+    wd = get_libc().inotify_add_watch(fd, os.fsencode(path), mask)
+    if wd < 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), path)
+    return wd
+
+class FileWatcher:
+    def __init__(self, paths, patterns=WATCH_PATTERNS, interval=POLL_INTERVAL, polling=False):
+        self.patterns = patterns
+        self.interval = interval
+        self.paths = set()
+        self.dirs = set()
+        self.watches = dict()
+        self.snapshot = dict()
+        self.changed = set()
+        self.last_change = None
+        self.fd = None
+        if not polling:
+            try:
+                self.fd = inotify_init()
+            except OSError:
+                pass
+        self.update(paths)
+
+    def is_polling(self):
+        return self.fd is None
+
+    def relevant(self, path):
+        if path in self.paths:
+            return True
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(name, x) for x in self.patterns)
+
+    def update(self, paths):
+        # Directories are watched rather than files, so editors that save
+        # through a rename and newly created sources are both noticed.
+        self.paths = set(os.path.abspath(x) for x in paths)
+        self.dirs = set(os.path.dirname(x) for x in self.paths)
+        if self.fd is not None:
+            for path in self.dirs - set(self.watches.values()):
+                try:
+                    self.watches[inotify_add_watch(self.fd, path, WATCH_MASK)] = path
+                except OSError:
+                    pass
+        else:
+            self.snapshot = self.scan()
+
+    def scan(self):
+        state = dict()
+        for path in self.dirs:
+            try:
+                for entry in os.scandir(path):
+                    if entry.is_file() and self.relevant(entry.path):
+                        st = entry.stat()
+                        state[entry.path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+        return state
+
+    def read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            pos = 0
+            while pos + event_header.size <= len(data):
+                wd, mask, cookie, length = event_header.unpack_from(data, pos)
+                name = data[pos + event_header.size:pos + event_header.size + length].rstrip(b"\0")
+                pos += event_header.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed |= self.paths
+                elif wd in self.watches and name:
+                    changed.add(os.path.join(self.watches[wd], os.fsdecode(name)))
+        return changed
+
+    def read(self):
+        if self.fd is not None:
+            changed = self.read_events()
+        else:
+            state = self.scan()
+            changed = set(x for x in set(state) | set(self.snapshot) if state.get(x) != self.snapshot.get(x))
+            self.snapshot = state
+        changed = set(x for x in changed if self.relevant(x))
+        if changed:
+            self.changed |= changed
+            self.last_change = time()
+        return changed
+
+    def attach(self, job, callback):
+        def check():
+            changed = self.read()
+            if changed:
+                callback(changed)
+        if self.fd is None or not job.add_watch(self.fd, check):
+            job.add_timer(self.interval, check)
+
+    def wait(self, debounce=DEBOUNCE):
+        # Returns once something changed and then stayed quiet for the
+        # debounce period, so a burst of saves gives a single rebuild.
+        while True:
+            if self.changed:
+                quiet = time() - self.last_change
+                if quiet >= debounce:
+                    changed, self.changed = self.changed, set()
+                    return changed
+                timeout = debounce - quiet
+            else:
+                timeout = None
+            if self.fd is not None:
+                select.select([ self.fd ], [], [], timeout)
+            else:
+                sleep(self.interval if timeout is None else min(timeout, self.interval))
+            self.read()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
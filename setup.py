@@ -25,7 +25,7 @@ setup(
 	author_email="mmicko@gmail.com",
 	description="FPGA - Command Line Interface",
 	license="ISC",
-	python_requires=">=3.6",
+	python_requires=">=3.7",
 	install_requires=[
 		"setuptools",
 		"click>=7",